@@ -0,0 +1,156 @@
+"""
+Command line interface for the simulation pipeline
+
+    python -m src simulate --decks 10000000 --seed 42 --workers 4
+    python -m src augment --base-decks 1000000 --decks 100 --seed 43
+    python -m src aggregate counts_100000_decks_seed1.npz counts_100000_decks_seed2.npz --output merged.npz
+    python -m src render --counts counts_1000000_decks.npz counts_1000100_decks_augmented.npz
+    python -m src responses --counts counts_1000000_decks.npz --output responses.json
+
+simulate & augment save a checkpoint of the counts after every batch
+& pick up from it when rerun with the same arguments.
+"""
+
+import argparse
+import os
+from src.aggregate import aggregate_results
+from src.datagen import BLOCK_DECKS, next_free_block
+from src.helpers import PATH_DATA
+from src.processing import HISTOGRAM_KEYS, checkpointed_outcomes, merge_counts, save_counts
+
+def checkpoint_name(output: str) -> str:
+    """
+    Name the checkpoint file of a run from its output file
+    """
+    return f'{os.path.splitext(output)[0]}.checkpoint.npz'
+
+def run_checkpointed(args, output: str, first_block: int = 0) -> dict:
+    """
+    Count the outcomes of args.decks decks, resuming from the checkpoint
+    of 'output' if there is one
+    """
+    return checkpointed_outcomes(n_decks = args.decks, checkpoint_file = checkpoint_name(output),
+                                 seed = args.seed, workers = args.workers,
+                                 batch_decks = args.batch_size, length = args.length,
+                                 half_deck_size = args.half_deck_size, first_block = first_block, 
+                                 histograms = args.histograms)
+
+def simulate(args) -> None:
+    """
+    Simulate args.decks decks from scratch & save their counts
+    """
+    output = args.output or f'counts_{args.decks}_decks_seed{args.seed}.npz'
+    counts = run_checkpointed(args, output)
+    save_counts(counts, output)
+    os.remove(os.path.join(PATH_DATA, checkpoint_name(output)))
+    print(f'Saved the counts of {counts["n_decks"]:,} decks as {output}')
+
+def augment(args) -> None:
+    """
+    Add the counts of args.decks new decks to existing counts
+    """
+    # Only needed to find the base counts, which may be older .npy files
+    from src.visualization import load_base_counts
+
+    total_decks = args.base_decks + args.decks
+    output = args.output or f'counts_{total_decks}_decks_augmented.npz'
+    base_counts = load_base_counts(args.base_decks)
+    # merge_counts drops histograms that do not cover every deck
+    if args.histograms and not all(key in base_counts for key in HISTOGRAM_KEYS):
+        raise ValueError(f'The counts of the {args.base_decks:,} base decks have no histograms, '
+                         'so the augmented counts could not have them either')
+    # Only draw decks from the seed's stream that the base counts never used
+    first_block = next_free_block(base_counts.get('provenance', []), args.seed,
+                                  half_deck_size = args.half_deck_size)
+    counts = merge_counts(base_counts, run_checkpointed(args, output, first_block))
+    save_counts(counts, output)
+    os.remove(os.path.join(PATH_DATA, checkpoint_name(output)))
+    print(f'Saved the counts of {counts["n_decks"]:,} decks as {output}')
+
+def aggregate(args) -> None:
+    """
+    Merge per-seed result files into one result
+    """
+    counts = aggregate_results(args.files, args.output)
+    print(f'Saved the counts of {counts["n_decks"]:,} decks from {len(args.files)} files '
+          f'as {args.output}')
+
+def render(args) -> None:
+    """
+    Draw the heatmaps of stored counts
+    """
+    from src.visualization import render_counts
+    render_counts(args.counts, args.output)
+
+def responses(args) -> None:
+    """
+    Precompute the ranked responses of stored counts
+    """
+    from src.query import response_table_from_counts
+    table = response_table_from_counts(args.counts, args.output, args.confidence)
+    print(f'Saved the responses from {table["n_decks"]:,} decks as {args.output}')
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the simulate/augment/aggregate/render/responses commands
+    """
+    parser = argparse.ArgumentParser(prog = 'python -m src',
+                                     description = "Simulate Penney's Game & draw the heatmaps")
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    simulation = argparse.ArgumentParser(add_help = False)
+    simulation.add_argument('--decks', type = int, required = True,
+                            help = 'number of decks to simulate')
+    simulation.add_argument('--seed', type = int, default = 42, help = 'random seed')
+    simulation.add_argument('--workers', type = int, default = 1,
+                            help = 'number of processes used for scoring')
+    simulation.add_argument('--batch-size', type = int, default = 20 * BLOCK_DECKS,
+                            help = f'decks per checkpoint (whole blocks of {BLOCK_DECKS:,})')
+    simulation.add_argument('--length', type = int, default = 3, help = 'length of the sequences')
+    simulation.add_argument('--half-deck-size', type = int, default = 26,
+                            help = 'cards of each color per deck')
+    simulation.add_argument('--histograms', action = 'store_true',
+                            help = 'also count the distributions of the tricks & card margins')
+    simulation.add_argument('--output', help = 'name of the counts .npz file in probability_data')
+
+    commands.add_parser('simulate', parents = [simulation],
+                        help = 'count the outcomes of newly generated decks').set_defaults(func = simulate)
+    augmenting = commands.add_parser('augment', parents = [simulation],
+                                     help = 'add newly generated decks to existing counts')
+    augmenting.add_argument('--base-decks', type = int, default = 1_000_000,
+                            help = 'number of decks behind the existing counts')
+    augmenting.set_defaults(func = augment)
+
+    aggregating = commands.add_parser('aggregate', help = 'merge per-seed result files')
+    aggregating.add_argument('files', nargs = '+', 
+                             help = 'names of the counts .npz files in probability_data')
+    aggregating.add_argument('--output', required = True, 
+                             help = 'name of the merged .npz file in probability_data')
+    aggregating.set_defaults(func = aggregate)
+
+    rendering = commands.add_parser('render', help = 'draw the heatmaps of stored counts')
+    rendering.add_argument('--counts', nargs = '+', required = True,
+                           help = 'names of the counts .npz files in probability_data')
+    rendering.add_argument('--output', nargs = '+', 
+                           help = 'names used for the heatmap PNGs (one per counts file)')
+    rendering.set_defaults(func = render)
+
+    ranking = commands.add_parser('responses', help = "rank player 2's responses to every sequence")
+    ranking.add_argument('--counts', required = True,
+                         help = 'name of the counts .npz file in probability_data')
+    ranking.add_argument('--output', default = 'responses.json',
+                         help = 'name of the response table .json file in probability_data')
+    ranking.add_argument('--confidence', type = float, default = 0.95,
+                         help = 'confidence level of the intervals')
+    ranking.set_defaults(func = responses)
+    return parser
+
+def main(argv = None) -> None:
+    """
+    Run the command given on the command line
+    """
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import numpy as np
+from src.datagen import block_range
+from src.processing import load_counts, merge_counts, save_counts
+
+def read_result(filename: str) -> dict:
+    """
+    Load a result file & tag its provenance entries with the file name
+
+    Args:
+        filename (str): The name of the counts .npz file (in the
+        probability_data folder)
+
+    Returns:
+        The outcome counts, with their 'provenance'
+    """
+    counts = load_counts(filename)
+    if 'provenance' not in counts:
+        raise ValueError(f'{filename} has no provenance, so its seeds cannot be checked')
+    # Entries merged earlier keep the file they first came from
+    counts['provenance'] = [{'file': filename, **entry} for entry in counts['provenance']]
+    return counts
+
+def provenance_key(entry: dict) -> tuple:
+    """
+    Identify the random stream behind a provenance entry
+
+    Two entries with the same key draw from the same stream: for
+    'blocks' streams they only share decks if their block ranges
+    overlap, for the other streams they always do.
+
+    Args:
+        entry (dict): A provenance entry (see processing.deck_provenance)
+
+    Returns:
+        A tuple of the stream, the seed, the number of cards per color &
+        the engine version (with the source file in place of an unknown seed)
+    """
+    seed = entry['seed'] if entry['seed'] is not None else entry.get('source', entry.get('file'))
+    return entry['stream'], seed, entry['half_deck_size'], entry.get('engine_version', 1)
+
+def find_duplicate_seeds(provenance: list[dict]) -> dict:
+    """
+    Find the random streams whose decks are used by more than one
+    provenance entry
+
+    Args:
+        provenance (list): Provenance entries of all of the results
+
+    Returns:
+        A dictionary mapping the key of each reused stream (see
+        provenance_key) to the files of the overlapping entries
+    """
+    entries = {}
+    for entry in provenance:
+        entries.setdefault(provenance_key(entry), []).append(entry)
+
+    duplicates = {}
+    for key, group in entries.items():
+        if key[0] != 'blocks':
+            overlapping = group if len(group) > 1 else []
+        else:
+            # Sorted by first block, each range must start after every
+            # earlier range has ended
+            overlapping, furthest = [], None
+            for entry in sorted(group, key = block_range):
+                first, stop = block_range(entry)
+                if furthest is not None and first < furthest[1]:
+                    overlapping += [furthest[0], entry]
+                if furthest is None or stop > furthest[1]:
+                    furthest = (entry, stop)
+        if overlapping:
+            duplicates[key] = sorted({str(entry.get('file')) for entry in overlapping})
+    return duplicates
+
+def tree_reduce(items: list,
+                combine
+                ):
+    """
+    Combine items pairwise, level by level, until one is left
+
+    Args:
+        items (list): The items to combine (at least one)
+        combine: A function combining two items into one
+
+    Returns:
+        The combined item
+    """
+    while len(items) > 1:
+        # An odd item out is carried up to the next level unchanged
+        items = [combine(items[k], items[k + 1]) if k + 1 < len(items) else items[k]
+                 for k in range(0, len(items), 2)]
+    return items[0]
+
+def aggregate_results(filenames: list[str],
+                      output_file: str | None = None
+                      ) -> dict:
+    """
+    Merge independently simulated result files into one result
+
+    The files are checked for decks counted more than once (the same
+    seed in two files, or twice in one file) before anything is merged.
+
+    Args:
+        filenames (list): The names of the counts .npz files (in the
+        probability_data folder)
+        output_file (str): The name of the merged .npz file (not saved
+        if None)
+
+    Returns:
+        The merged outcome counts, whose 'provenance' lists every seed
+        & the file it came from
+    """
+    results = [read_result(filename) for filename in filenames]
+    lengths = {result['tricks'].shape for result in results}
+    if len(lengths) > 1:
+        raise ValueError(f'The results are for different sequence lengths: {sorted(lengths)}')
+
+    duplicates = find_duplicate_seeds([entry for result in results
+                                       for entry in result['provenance']])
+    if duplicates:
+        details = '; '.join(f'seed {key[1]} ({key[0]}) in {", ".join(map(str, names))}'
+                            for key, names in duplicates.items())
+        raise ValueError(f'Some decks would be counted twice: {details}')
+
+    merged = tree_reduce(results, merge_counts)
+    # Antithetic results count several samples per deck, & the per-pair 
+    # deck counts of adaptive results are largest on the diagonal
+    if np.max(merged['n_decks']) != sum(entry['n_decks'] * entry.get('samples_per_deck', 1)
+                                for entry in merged['provenance']):
+        raise ValueError('The provenance does not add up to the number of decks')
+    if output_file is not None:
+        save_counts(merged, output_file)
+    return merged
@@ -0,0 +1,189 @@
+import json
+import os
+import platform
+import shutil
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from src.datagen import get_decks, store_decks
+from src.helpers import PATH_DATA
+from src.processing import calculate_win_probabilities, penneys_game, play_game, sequence_to_binary
+
+# Deck counts from 10^3 to 10^7
+DECK_COUNTS = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+# Largest deck count run for each target: the pure-Python play_game path 
+# is capped
+MAX_DECKS = {'get_decks': 10**7,
+             'store_decks_save': 10**7,
+             'store_decks_load': 10**7,
+             'play_game': 10**4,
+             'penneys_game': 10**7,
+             'calculate_win_probabilities': 10**7}
+
+# Pair of sequences used by the single-pair targets
+P1_SEQUENCE, P2_SEQUENCE = 'BRR', 'BBR'
+
+# Deck store written & removed by the store_decks targets
+BENCHMARK_STORE = 'benchmark_decks'
+
+def benchmark_targets(n_decks: int,
+                      seed: int = 0
+                      ) -> dict:
+    """
+    Build the functions timed by the benchmark for 'n_decks' decks
+
+    Args:
+        n_decks (int): The number of decks
+        seed (int): The seed used when generating the decks
+
+    Returns:
+        A dictionary mapping each target name to a (setup, run) pair:
+        setup is called before every run (untimed) & returns the
+        argument passed to run
+    """
+    p1_binary = tuple(sequence_to_binary(P1_SEQUENCE).tolist())
+    p2_binary = tuple(sequence_to_binary(P2_SEQUENCE).tolist())
+
+    def fresh_store():
+        shutil.rmtree(os.path.join(PATH_DATA, BENCHMARK_STORE), ignore_errors = True)
+
+    def existing_store():
+        if not os.path.exists(os.path.join(PATH_DATA, BENCHMARK_STORE)):
+            store_decks(n_decks, seed, filename = BENCHMARK_STORE)
+
+    def play_all(decks):
+        for deck in decks:
+            play_game(deck, p1_binary, p2_binary)
+
+    return {
+        'get_decks': (lambda: None,
+                      lambda _: get_decks(n_decks, seed)),
+        'store_decks_save': (fresh_store,
+                             lambda _: store_decks(n_decks, seed, filename = BENCHMARK_STORE)),
+        'store_decks_load': (existing_store,
+                             lambda _: store_decks(n_decks, seed, filename = BENCHMARK_STORE)),
+        'play_game': (lambda: get_decks(n_decks, seed).tolist(),
+                      play_all),
+        'penneys_game': (lambda: None,
+                         lambda _: penneys_game(P1_SEQUENCE, P2_SEQUENCE,
+                                                n_decks = n_decks, seed = seed)),
+        'calculate_win_probabilities': (lambda: None,
+                                        lambda _: calculate_win_probabilities(n_decks = n_decks,
+                                                                              seed = seed))
+    }
+
+def measure(setup,
+            run,
+            repeat: int = 1,
+            memory: bool = True
+            ) -> dict:
+    """
+    Time a target & (optionally) measure its peak memory
+
+    The peak memory is measured in a separate run under tracemalloc,
+    since tracing every allocation would slow down the timed runs.
+
+    Args:
+        setup: Function called (untimed) before each run
+        run: The function to measure, called with the result of setup
+        repeat (int): The number of timed runs (the fastest is kept)
+        memory (bool): Also measure the peak memory of one run
+
+    Returns:
+        A dictionary with the 'seconds' of the fastest run & the
+        'peak_bytes' (None if memory is False)
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - start)
+
+    peak_bytes = None
+    if memory:
+        argument = setup()
+        tracemalloc.start()
+        try:
+            run(argument)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(times), 'peak_bytes': peak_bytes}
+
+def run_benchmarks(deck_counts: list = DECK_COUNTS,
+                   targets: list | None = None,
+                   max_decks: dict = MAX_DECKS,
+                   repeat: int = 1,
+                   memory: bool = True,
+                   seed: int = 0
+                   ) -> dict:
+    """
+    Benchmark deck generation, storage & scoring across deck counts
+
+    Args:
+        deck_counts (list): The numbers of decks to run each target with
+        targets (list): The names of the targets to run (all if None)
+        max_decks (dict): The largest deck count run for each target
+        repeat (int): The number of timed runs per measurement
+        memory (bool): Also measure the peak memory of each measurement
+        seed (int): The seed used when generating the decks
+
+    Returns:
+        A dictionary with the environment of the run & one result
+        (target, n_decks, seconds, decks_per_second, peak_bytes) per
+        measurement
+    """
+    results = []
+    try:
+        for n_decks in deck_counts:
+            for name, (setup, run) in benchmark_targets(n_decks, seed).items():
+                if targets is not None and name not in targets:
+                    continue
+                if n_decks > max_decks.get(name, n_decks):
+                    continue
+                # The store of a smaller deck count cannot be reused
+                shutil.rmtree(os.path.join(PATH_DATA, BENCHMARK_STORE), ignore_errors = True)
+                result = measure(setup, run, repeat = repeat, memory = memory)
+                results.append({'target': name, 'n_decks': n_decks, **result,
+                                'decks_per_second': n_decks / result['seconds']})
+                print(f'{name:>28} {n_decks:>10,} decks: {result["seconds"]:9.3f} s, '
+                      f'{n_decks / result["seconds"]:>14,.0f} decks/s')
+    finally:
+        shutil.rmtree(os.path.join(PATH_DATA, BENCHMARK_STORE), ignore_errors = True)
+
+    return {'timestamp': datetime.now().isoformat(timespec = 'seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'results': results}
+
+def save_benchmarks(report: dict,
+                    output_file: str | None = None
+                    ) -> str:
+    """
+    Write a benchmark report as JSON
+
+    Args:
+        report (dict): The report from run_benchmarks
+        output_file (str): The path of the JSON file, a timestamped file
+        in the benchmarks folder if None
+
+    Returns:
+        The path of the JSON file
+    """
+    if output_file is None:
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        output_file = os.path.join('benchmarks', f'benchmark_{timestamp}.json')
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok = True)
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent = 2)
+    return output_file
+
+if __name__ == '__main__':
+    report = run_benchmarks()
+    print(f'Saved the benchmark to {save_benchmarks(report)}')
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from src.helpers import PATH_DATA
+
+# Cached results live in their own folder with an index of every entry
+CACHE_DIR = os.path.join(PATH_DATA, 'cache')
+INDEX_FILE = 'index.json'
+MAX_CACHE_BYTES = 256 * 1024**2
+MAX_CACHE_ENTRIES = 512
+
+def cache_key(params: dict
+              ) -> str:
+    """
+    Hash the parameters of a simulation into a cache key
+
+    Args:
+        params (dict): Everything that determines the result (seed,
+        number of decks, rules, engine version, ...), as JSON values
+
+    Returns:
+        The hex SHA-256 digest of the parameters
+    """
+    text = json.dumps(params, sort_keys = True, separators = (',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def read_index(cache_dir: str = CACHE_DIR
+               ) -> dict:
+    """
+    Read the index of the cache
+
+    Args:
+        cache_dir (str): The folder of the cache
+
+    Returns:
+        A dictionary mapping each key to its 'file', 'params',
+        'size' (bytes) & 'last_used' (UNIX time)
+    """
+    index_file = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file) as f:
+        return json.load(f)
+
+def write_index(index: dict,
+                cache_dir: str = CACHE_DIR
+                ) -> None:
+    """
+    Atomically replace the index of the cache
+
+    Args:
+        index (dict): The index to write
+        cache_dir (str): The folder of the cache
+    """
+    index_file = os.path.join(cache_dir, INDEX_FILE)
+    with open(index_file + '.tmp', 'w') as f:
+        json.dump(index, f, indent = 2)
+    os.replace(index_file + '.tmp', index_file)
+
+def cache_lookup(params: dict,
+                 cache_dir: str = CACHE_DIR
+                 ) -> dict | None:
+    """
+    Look up a cached result
+
+    Args:
+        params (dict): The parameters of the simulation
+        cache_dir (str): The folder of the cache
+
+    Returns:
+        The cached arrays, or None if there is no entry for 'params'
+    """
+    key = cache_key(params)
+    index = read_index(cache_dir)
+    entry = index.get(key)
+    if entry is None or not os.path.exists(os.path.join(cache_dir, entry['file'])):
+        return None
+
+    with np.load(os.path.join(cache_dir, entry['file'])) as data:
+        arrays = {name: data[name] for name in data.files}
+    # Mark the entry as recently used
+    entry['last_used'] = time.time()
+    write_index(index, cache_dir)
+    return arrays
+
+def cache_store(params: dict,
+                arrays: dict,
+                cache_dir: str = CACHE_DIR,
+                max_bytes: int = MAX_CACHE_BYTES,
+                max_entries: int = MAX_CACHE_ENTRIES
+                ) -> str:
+    """
+    Add a result to the cache, then evict old entries if it is too big
+
+    Args:
+        params (dict): The parameters of the simulation
+        arrays (dict): The arrays of the result
+        cache_dir (str): The folder of the cache
+        max_bytes (int): The largest total size of the cached files
+        max_entries (int): The most entries kept
+
+    Returns:
+        The key of the new entry
+    """
+    os.makedirs(cache_dir, exist_ok = True)
+    key = cache_key(params)
+    filename = f'{key}.npz'
+    np.savez(os.path.join(cache_dir, filename), **arrays)
+
+    index = read_index(cache_dir)
+    index[key] = {'file': filename, 'params': params,
+                  'size': os.path.getsize(os.path.join(cache_dir, filename)),
+                  'last_used': time.time()}
+    evict(index, cache_dir, max_bytes = max_bytes, max_entries = max_entries)
+    write_index(index, cache_dir)
+    return key
+
+def evict(index: dict,
+          cache_dir: str = CACHE_DIR,
+          max_bytes: int = MAX_CACHE_BYTES,
+          max_entries: int = MAX_CACHE_ENTRIES
+          ) -> list[str]:
+    """
+    Remove the least recently used entries until the cache fits its limits
+
+    Args:
+        index (dict): The index of the cache (updated in place)
+        cache_dir (str): The folder of the cache
+        max_bytes (int): The largest total size of the cached files
+        max_entries (int): The most entries kept
+
+    Returns:
+        The keys of the removed entries
+    """
+    removed = []
+    by_age = sorted(index, key = lambda key: index[key]['last_used'])
+    total_bytes = sum(entry['size'] for entry in index.values())
+    while by_age and (len(index) > max_entries or total_bytes > max_bytes):
+        key = by_age.pop(0)
+        entry = index.pop(key)
+        total_bytes -= entry['size']
+        path = os.path.join(cache_dir, entry['file'])
+        if os.path.exists(path):
+            os.remove(path)
+        removed.append(key)
+    return removed
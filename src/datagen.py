@@ -1,83 +1,469 @@
 import numpy as np
+import json
 import os
-from src.helpers import PATH_DATA
+from functools import partial
+from src.helpers import PATH_DATA, timed
 
 HALF_DECK_SIZE = 26
 
+# Packed deck files start with a fixed-size header (magic, seed, number of 
+# decks, cards per deck) followed by one row of packed bits per deck
+DECK_FILE_MAGIC = b'PENNEY01'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('seed', '<i8'), 
+                         ('n_decks', '<i8'), ('num_cards', '<i8')])
+
+# Deck stores are folders of packed chunk files plus a manifest
+MANIFEST_FILE = 'manifest.json'
+CHUNK_DECKS = 1_000_000
+
+# Decks generated from a seed come in fixed-size blocks, each with its own 
+# spawned random stream, so the decks never depend on how they are split up
+BLOCK_DECKS = 50_000
+
+@timed()
 def get_decks(n_decks: int,
-              seed: int, 
+              seed: int | np.random.SeedSequence, 
               half_deck_size: int = HALF_DECK_SIZE 
-              ) -> tuple[np.ndarray, np.ndarray]:
+              ) -> np.ndarray:
     """
     Efficiently generate 'n_decks' shuffled decks using NumPy
 
+    The cards are dealt one position at a time for all of the decks at 
+    once: each card is red with probability (reds left) / (cards left), 
+    which gives every arrangement of the deck the same probability. Only 
+    the uint8 decks (1 byte per card) and one column of random integers 
+    are allocated.
+
     Args:
         n_decks (int): The number of decks to generate
-        seed (int): The seed for the random number generator
+        seed (int | SeedSequence): The seed for the random number generator
         half_deck_size (int): The number of cards in half a deck (26)
     
     Returns:
-        decks (np.ndarray): 2D array of shape (n_decks, num_cards), 
+        decks (np.ndarray): uint8 array of shape (n_decks, num_cards), 
         where each row is a shuffled deck
     """
-    # Generate the initial deck with 0's and 1's
-    init_deck = [0] * half_deck_size + [1] * half_deck_size
-    decks = np.tile(init_deck, (n_decks, 1))
-    # Shuffle the decks using a random number generator
     rng = np.random.default_rng(seed)
-    # Use permutation function to fill the decks with shuffled cards
-    rng.permuted(decks, axis = 1, out = decks)
-    return decks
+    num_cards = 2 * half_deck_size
+    # Filled one card position (row) at a time, then transposed
+    decks = np.empty((num_cards, n_decks), dtype = np.uint8)
+    blacks_left = np.full(n_decks, half_deck_size, dtype = np.min_scalar_type(num_cards))
+    for card in range(num_cards):
+        # A uniform pick among the cards left is red if it is past the blacks
+        pick = rng.integers(0, num_cards - card, size = n_decks, dtype = blacks_left.dtype)
+        np.greater_equal(pick, blacks_left, out = decks[card].view(bool))
+        blacks_left -= 1 - decks[card]
+    return np.ascontiguousarray(decks.T)
+
+def generate_decks(n_decks: int, 
+                   seed: int, 
+                   packed: bool = False, 
+                   half_deck_size: int = HALF_DECK_SIZE, 
+                   first_block: int = 0
+                   ):
+    """
+    Lazily generate shuffled decks one block at a time
+
+    Only one block (BLOCK_DECKS decks) is in memory at a time, however 
+    many decks are generated, and the blocks are the same as those of 
+    deck_block_loaders, so the decks never depend on how they are split.
+
+    Args:
+        n_decks (int): The number of decks to generate
+        seed (int): The root seed
+        packed (bool): Yield the decks packed into bits (see pack_decks)
+        half_deck_size (int): The number of cards of each color
+        first_block (int): The index of the first block
+
+    Yields:
+        uint8 arrays of shape (block, num_cards), or (block, 
+        ceil(num_cards / 8)) when packed
+    """
+    for loader in deck_block_loaders(n_decks, seed, half_deck_size = half_deck_size, 
+                                     first_block = first_block):
+        decks = loader()
+        yield pack_decks(decks) if packed else decks
+
+def deck_block_loaders(n_decks: int, 
+                       seed: int, 
+                       block_decks: int = BLOCK_DECKS, 
+                       half_deck_size: int = HALF_DECK_SIZE, 
+                       first_block: int = 0
+                       ) -> list:
+    """
+    Split the generation of 'n_decks' decks into independent blocks
+
+    Block b is shuffled with the b-th stream spawned from the seed's 
+    SeedSequence, so the same seed always gives the same decks no matter 
+    which process (or how many processes) generates each block. Starting 
+    at a later block continues the same seed with decks never used before.
+
+    Args:
+        n_decks (int): The number of decks to generate
+        seed (int): The root seed
+        block_decks (int): The number of decks per block
+        half_deck_size (int): The number of cards of each color 
+        (26 per pack of cards, so 52 for a 2-pack shoe)
+        first_block (int): The index of the first block (see next_free_block)
+
+    Returns:
+        A list of loaders (functions with no arguments that can be sent 
+        to other processes) each returning one block of decks
+    """
+    n_blocks = -(-n_decks // block_decks)
+    # The same streams as SeedSequence(seed).spawn(...)[first_block:]
+    streams = [np.random.SeedSequence(seed, spawn_key = (first_block + b,)) 
+               for b in range(n_blocks)]
+    return [partial(get_decks, min(block_decks, n_decks - b * block_decks), stream, half_deck_size)
+            for b, stream in enumerate(streams)]
+
+def block_range(entry: dict
+                ) -> tuple[int, int]:
+    """
+    Find the blocks of a seed's stream used by a provenance entry
+
+    Args:
+        entry (dict): A provenance entry of decks from deck_block_loaders 
+        (see processing.deck_provenance)
+
+    Returns:
+        The first block & the block after the last one (a partially used 
+        last block counts as used)
+    """
+    first = entry.get('first_block', 0)
+    return first, first + -(-entry['n_decks'] // entry.get('block_decks', BLOCK_DECKS))
+
+def consumed_blocks(provenance: list[dict], 
+                    seed: int, 
+                    half_deck_size: int = HALF_DECK_SIZE
+                    ) -> list[tuple[int, int]]:
+    """
+    Find the blocks of a seed's deck stream that some counts already used
+
+    Block b is shuffled with the b-th spawned stream whatever the number 
+    of decks per block. Blocks of different sizes with the same index do 
+    not hold the same decks (every card position is drawn across the 
+    whole block), but they share random draws, so their decks are not 
+    independent & they are all counted here.
+
+    Args:
+        provenance (list): The provenance entries of the counts
+        seed (int): The root seed of the stream
+        half_deck_size (int): The number of cards of each color
+
+    Returns:
+        The sorted (first block, stop block) ranges used from the stream
+    """
+    return sorted(block_range(entry) for entry in provenance 
+                  if entry.get('stream') == 'blocks' and entry['seed'] == seed 
+                  and entry.get('half_deck_size', HALF_DECK_SIZE) == half_deck_size)
+
+def next_free_block(provenance: list[dict], 
+                    seed: int, 
+                    half_deck_size: int = HALF_DECK_SIZE
+                    ) -> int:
+    """
+    Find where a seed's deck stream continues with decks not used yet
+
+    Args:
+        provenance (list): The provenance entries of the counts
+        seed (int): The root seed of the stream
+        half_deck_size (int): The number of cards of each color
+
+    Returns:
+        The first block after every block already used from the stream
+    """
+    used = consumed_blocks(provenance, seed, half_deck_size)
+    return max((stop for _, stop in used), default = 0)
+
+def pack_decks(decks: np.ndarray
+               ) -> np.ndarray:
+    """
+    Pack each deck into bits (1 bit per card, 7 bytes for 52 cards)
+
+    Args:
+        decks (np.ndarray): 2D array of shape (n_decks, num_cards)
+
+    Returns:
+        A uint8 array of shape (n_decks, ceil(num_cards / 8))
+    """
+    return np.packbits(np.asarray(decks, dtype = np.uint8), axis = 1, bitorder = 'little')
+
+def unpack_decks(packed: np.ndarray, 
+                 num_cards: int = 2 * HALF_DECK_SIZE
+                 ) -> np.ndarray:
+    """
+    Unpack decks that were packed with pack_decks
+
+    Args:
+        packed (np.ndarray): Array of shape (n_decks, ceil(num_cards / 8))
+        num_cards (int): The number of cards in each deck
+
+    Returns:
+        A uint8 array of shape (n_decks, num_cards) of 0's and 1's
+    """
+    return np.unpackbits(packed, axis = 1, count = num_cards, bitorder = 'little')
+
+def write_deck_file(path: str, 
+                    decks, 
+                    seed: int
+                    ) -> None:
+    """
+    Write decks to a packed deck file
+
+    Args:
+        path (str): The path of the packed deck file
+        decks: 2D array of shape (n_decks, num_cards), or a list of 
+        loaders returning such arrays (written one at a time)
+        seed (int): The seed used to generate the decks
+    """
+    if isinstance(decks, np.ndarray):
+        decks = [decks]
+    n_decks, num_cards = 0, 2 * HALF_DECK_SIZE
+    with open(path, 'wb') as f:
+        # Reserve the header, which is written once the size is known
+        f.write(bytes(HEADER_DTYPE.itemsize))
+        for block in decks:
+            block = np.asarray(block() if callable(block) else block)
+            n_decks, num_cards = n_decks + block.shape[0], block.shape[1]
+            f.write(pack_decks(block).tobytes())
+        f.seek(0)
+        f.write(np.array([(DECK_FILE_MAGIC, seed, n_decks, num_cards)], 
+                         dtype = HEADER_DTYPE).tobytes())
+
+def open_deck_file(path: str
+                   ) -> tuple[np.ndarray, dict]:
+    """
+    Memory-map a packed deck file without reading the decks into RAM
+
+    Args:
+        path (str): The path of the packed deck file
+
+    Returns:
+        packed (np.ndarray): Read-only memory map of the packed decks, 
+        of shape (n_decks, ceil(num_cards / 8))
+        header (dict): The 'seed', 'n_decks' & 'num_cards' of the file
+    """
+    header = np.fromfile(path, dtype = HEADER_DTYPE, count = 1)
+    if len(header) == 0 or header['magic'][0] != DECK_FILE_MAGIC:
+        raise ValueError(f'{path} is not a packed deck file')
+    header = {name: int(header[name][0]) for name in ('seed', 'n_decks', 'num_cards')}
+
+    row_bytes = (header['num_cards'] + 7) // 8
+    if header['n_decks'] == 0:
+        return np.zeros((0, row_bytes), dtype = np.uint8), header
+    packed = np.memmap(path, dtype = np.uint8, mode = 'r', offset = HEADER_DTYPE.itemsize, 
+                       shape = (header['n_decks'], row_bytes))
+    return packed, header
+
+def read_manifest(store_dir: str
+                  ) -> dict:
+    """
+    Read the manifest of a deck store
+
+    Args:
+        store_dir (str): The folder of the deck store
+
+    Returns:
+        The manifest, with 'num_cards' and a list of 'chunks', each 
+        recording the chunk's 'file', 'seed' & 'n_decks'
+    """
+    manifest_file = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return {'num_cards': 2 * HALF_DECK_SIZE, 'chunks': []}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+def write_manifest(store_dir: str, 
+                   manifest: dict
+                   ) -> None:
+    """
+    Atomically replace the manifest of a deck store
 
+    The new manifest is written to a temporary file first, so a crash 
+    never leaves a half-written manifest behind.
+
+    Args:
+        store_dir (str): The folder of the deck store
+        manifest (dict): The manifest to write
+    """
+    manifest_file = os.path.join(store_dir, MANIFEST_FILE)
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent = 2)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+@timed()
+def append_decks(store_dir: str, 
+                 n_decks: int, 
+                 seed: int, 
+                 chunk_decks: int = CHUNK_DECKS
+                 ) -> list[dict]:
+    """
+    Append newly generated decks to a deck store as new chunk files
+
+    Only the new decks are written: existing chunks are never read or 
+    rewritten, and the manifest is updated once every new chunk is on 
+    disk, so an interrupted append leaves the store unchanged. A chunk 
+    holds the decks of deck_block_loaders for its seed, so scoring the 
+    store gives the same counts as generating the decks from the seeds.
+
+    Args:
+        store_dir (str): The folder of the deck store
+        n_decks (int): The number of decks to add
+        seed (int): The seed of the first new chunk (the next chunks 
+        use seed + 1, seed + 2, ...)
+        chunk_decks (int): The maximum number of decks per chunk file
+
+    Returns:
+        The manifest entries of the new chunks
+    """
+    os.makedirs(store_dir, exist_ok = True)
+    manifest = read_manifest(store_dir)
+
+    new_chunks = []
+    for start in range(0, n_decks, chunk_decks):
+        chunk = {'file': f'chunk_{len(manifest["chunks"]) + len(new_chunks):05d}.bin', 
+                 'seed': seed + len(new_chunks), 
+                 'n_decks': min(chunk_decks, n_decks - start), 
+                 'stream': 'blocks'}
+        write_deck_file(os.path.join(store_dir, chunk['file']), 
+                        deck_block_loaders(chunk['n_decks'], chunk['seed']), seed = chunk['seed'])
+        new_chunks.append(chunk)
+
+    manifest['chunks'].extend(new_chunks)
+    write_manifest(store_dir, manifest)
+    return new_chunks
+
+@timed()
 def store_decks(n_decks: int, 
                 seed: int, 
-                filename: str = 'penneydecks.npy', 
+                filename: str = 'penneydecks', 
                 augment: bool = False
                 ) -> tuple[np.ndarray, int]:
     """
-    Store and/or load the shuffled decks in a NumPy file
+    Store and/or load the shuffled decks in an append-only deck store
 
     Args:
         n_decks (int): The number of decks to generate
         seed (int): The random seed
-        filename (str): The name of the file thats stores the decks
+        filename (str): The name of the folder thats stores the decks
         augment (bool): Option to augment the data
 
     Returns:
         decks (np.ndarray): 2D array of shape (n_decks, num_cards), 
-        where each row is a shuffled deck
-        seed (int): The seed used to generate the shuffled decks
+        where each row is a shuffled deck (only the new decks when 
+        augmenting)
+        seed (int): The seed used to generate the (new) shuffled decks
     """
-    # Specify the path for decks_file
-    decks_file = os.path.join(PATH_DATA, filename)
-    os.makedirs(PATH_DATA, exist_ok=True)
-
-    # Check if the file already exists
-    if os.path.exists(decks_file):
-        data = np.load(decks_file, allow_pickle = True).item() 
-        # Load decks/seeds from the file
-        existing_decks = data['decks']
-        current_seed = data['seed']
+    # Specify the path for the deck store
+    store_dir = os.path.join(PATH_DATA, filename)
+    chunks = read_manifest(store_dir)['chunks']
 
+    # Check if the store already exists
+    if chunks:
         # If choosing to augment with additional decks
         if augment:
-            additional_decks = get_decks(n_decks, seed = current_seed + 1)
-            # Append new decks to existing decks
-            updated_decks = np.concatenate((existing_decks, additional_decks), axis = 0)
-            # Update data with new decks and save
-            data['decks'] = updated_decks 
-            data['seed'] = current_seed + 1
-            np.save(decks_file, data)
-            return updated_decks, current_seed + 1
+            # Continue from the seed after the last chunk
+            new_chunks = append_decks(store_dir, n_decks, seed = chunks[-1]['seed'] + 1)
+            new_decks = load_decks(filename, first_chunk = len(chunks))[0]
+            return new_decks, new_chunks[0]['seed']
         else:
-            return existing_decks, current_seed
-    # If the file does not exist, generate the decks
+            # Load decks/seeds from the store
+            return load_decks(filename)
+    # If the store does not exist, generate the decks
     else:
-        decks = get_decks(n_decks, seed = seed)
-        data = {'decks': decks, 'seed': seed}
-        # Save the decks/seeds
-        np.save(decks_file, data)
-        return decks, seed
+        append_decks(store_dir, n_decks, seed = seed)
+        return load_decks(filename)
+
+@timed()
+def load_decks(filename: str = 'penneydecks', 
+               first_chunk: int = 0
+               ) -> tuple[np.ndarray, int]:
+    """
+    Load the shuffled decks saved by store_decks
+
+    Args:
+        filename (str): The name of the folder thats stores the decks
+        first_chunk (int): The index of the first chunk to load
+
+    Returns:
+        decks (np.ndarray): 2D array of shape (n_decks, num_cards), 
+        where each row is a shuffled deck
+        seed (int): The seed used to generate the first loaded chunk
+    """
+    chunks = read_manifest(os.path.join(PATH_DATA, filename))['chunks'][first_chunk:]
+    if not chunks:
+        raise FileNotFoundError(f'No decks stored in {filename}')
+    decks = np.concatenate(list(stream_decks(filename, first_chunk = first_chunk)))
+    return decks, chunks[0]['seed']
+
+def stream_decks(filename: str = 'penneydecks', 
+                 chunk_size: int = 20_000, 
+                 first_chunk: int = 0
+                 ):
+    """
+    Lazily stream the shuffled decks saved by store_decks in chunks
+
+    Chunk files are memory-mapped and only one chunk at a time is 
+    unpacked, so memory use does not grow with the size of the store.
+
+    Args:
+        filename (str): The name of the folder thats stores the decks
+        chunk_size (int): The maximum number of decks per chunk
+        first_chunk (int): The index of the first chunk file to read
+
+    Yields:
+        2D arrays of shape (chunk_size, num_cards)
+    """
+    store_dir = os.path.join(PATH_DATA, filename)
+    for chunk in read_manifest(store_dir)['chunks'][first_chunk:]:
+        packed, header = open_deck_file(os.path.join(store_dir, chunk['file']))
+        for start in range(0, header['n_decks'], chunk_size):
+            yield unpack_decks(packed[start:start + chunk_size], header['num_cards'])
+
+def read_deck_range(path: str, 
+                    start: int, 
+                    stop: int
+                    ) -> np.ndarray:
+    """
+    Read and unpack decks [start, stop) of a packed deck file
+
+    Args:
+        path (str): The path of the packed deck file
+        start (int): The index of the first deck
+        stop (int): The index after the last deck
+
+    Returns:
+        2D array of shape (stop - start, num_cards)
+    """
+    packed, header = open_deck_file(path)
+    return unpack_decks(packed[start:stop], header['num_cards'])
+
+def store_loaders(filename: str = 'penneydecks', 
+                  chunk_size: int = BLOCK_DECKS, 
+                  first_chunk: int = 0
+                  ) -> list:
+    """
+    Split the decks saved by store_decks into loaders for other processes
+
+    Each loader memory-maps its chunk file and reads only its own range.
+
+    Args:
+        filename (str): The name of the folder thats stores the decks
+        chunk_size (int): The maximum number of decks per loader
+        first_chunk (int): The index of the first chunk file to read
+
+    Returns:
+        A list of loaders, each returning a 2D array of decks
+    """
+    store_dir = os.path.join(PATH_DATA, filename)
+    loaders = []
+    for chunk in read_manifest(store_dir)['chunks'][first_chunk:]:
+        path = os.path.join(store_dir, chunk['file'])
+        for start in range(0, chunk['n_decks'], chunk_size):
+            loaders.append(partial(read_deck_range, path, start, 
+                                   min(start + chunk_size, chunk['n_decks'])))
+    return loaders
 
 def augmenting_decks(n_decks: int, 
                      augment_decks: int, 
@@ -1,8 +1,29 @@
 from typing import Callable
-from datetime import datetime as dt
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+import cProfile
+import csv
+import json
+import os
+import tracemalloc
+import numpy as np
 
 PATH_DATA = 'probability_data'
 
+# In-process registry of every instrumented stage:
+# name -> {'calls', 'total_ns', 'max_ns', 'peak_bytes'}
+TIMINGS = {}
+# cProfile captures of the stages chosen with configure_instrumentation
+PROFILES = {}
+# Opt-in extras: tracemalloc peaks for every stage & cProfile for some stages
+INSTRUMENTATION = {'memory': False, 'profile': set()}
+
+# Traced memory at the start of each running stage & the highest peak
+# reached by the stages nested inside it
+_memory_stack = []
+_profiling = [False]
+
 def debugger_factory(show_args = True) -> Callable:
     """
     Debugger factory function
@@ -11,19 +32,209 @@ def debugger_factory(show_args = True) -> Callable:
         """
         Decorator that prints arguments & runtime
         """
+        @wraps(func)
         def wrapper(*args, **kwargs):
             """
             Wrapper that prints arguments & runtime
             """
             if show_args:
                 print(f'{func.__name__} was called with:')
-                print('Positional arguments:\n', args)
-                print('Keyword arguments:\n', kwargs)
-            # Create a timestamp (t0) 
-            t0 = dt.now()
+                print('Positional arguments:\n', [summarize(arg) for arg in args])
+                print('Keyword arguments:\n', {key: summarize(value) for key, value in kwargs.items()})
+            # Create a timestamp (t0)
+            t0 = perf_counter_ns()
             results = func(*args, **kwargs)
             # Print runtime and return results
-            print(f'{func.__name__} ran for {dt.now() - t0}')
+            print(f'{func.__name__} ran for {(perf_counter_ns() - t0) / 1e9:.6f} s')
             return results
         return wrapper
     return debugger
+
+def summarize(value) -> str:
+    """
+    Describe an argument without printing every element of large arrays
+
+    Args:
+        value: Any argument
+
+    Returns:
+        The shape & dtype of arrays, or else the repr of the value
+    """
+    if isinstance(value, np.ndarray):
+        return f'ndarray(shape={value.shape}, dtype={value.dtype})'
+    return repr(value)
+
+def configure_instrumentation(memory: bool = False,
+                              profile = ()
+                              ) -> None:
+    """
+    Choose the opt-in extras recorded by timed & stage
+
+    Args:
+        memory (bool): Record the tracemalloc peak of every stage
+        (slows down allocation-heavy code)
+        profile: The names of the stages to capture with cProfile
+    """
+    INSTRUMENTATION['memory'] = memory
+    INSTRUMENTATION['profile'] = set(profile)
+
+@contextmanager
+def stage(name: str):
+    """
+    Context manager recording the runtime of a stage in TIMINGS
+
+    Stages can be nested. Only stages run in this process are recorded
+    (work done inside worker processes is timed by the stage that
+    waits for it).
+
+    Args:
+        name (str): The name of the stage
+    """
+    memory = INSTRUMENTATION['memory']
+    profiler = None
+    if name in INSTRUMENTATION['profile'] and not _profiling[0]:
+        profiler = PROFILES.setdefault(name, cProfile.Profile())
+    if memory:
+        _start_memory()
+    if profiler is not None:
+        _profiling[0] = True
+        profiler.enable()
+    t0 = perf_counter_ns()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter_ns() - t0
+        if profiler is not None:
+            profiler.disable()
+            _profiling[0] = False
+        _record(name, elapsed, _stop_memory() if memory else None)
+
+def timed(name: str | None = None) -> Callable:
+    """
+    Decorator recording the runtime of every call in TIMINGS
+
+    Args:
+        name (str): The name of the stage (module.function if None)
+    """
+    def decorator(func: Callable) -> Callable:
+        stage_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Skip the context manager unless an extra is switched on
+            if not INSTRUMENTATION['memory'] and not INSTRUMENTATION['profile']:
+                t0 = perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _record(stage_name, perf_counter_ns() - t0, None)
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _record(name: str,
+            elapsed_ns: int,
+            peak_bytes: int | None
+            ) -> None:
+    """
+    Add one call of a stage to TIMINGS
+    """
+    entry = TIMINGS.get(name)
+    if entry is None:
+        entry = TIMINGS[name] = {'calls': 0, 'total_ns': 0, 'max_ns': 0, 'peak_bytes': None}
+    entry['calls'] += 1
+    entry['total_ns'] += elapsed_ns
+    entry['max_ns'] = max(entry['max_ns'], elapsed_ns)
+    if peak_bytes is not None:
+        entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak_bytes)
+
+def _start_memory() -> None:
+    """
+    Start measuring the tracemalloc peak of a stage
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    # Keep the peak of the enclosing stage before resetting it
+    if _memory_stack:
+        _memory_stack[-1][1] = max(_memory_stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    _memory_stack.append([current, 0])
+
+def _stop_memory() -> int:
+    """
+    Finish measuring the tracemalloc peak of a stage
+
+    Returns:
+        The peak traced memory (bytes) above the start of the stage
+    """
+    _, peak = tracemalloc.get_traced_memory()
+    start, nested_peak = _memory_stack.pop()
+    peak = max(peak, nested_peak)
+    if _memory_stack:
+        _memory_stack[-1][1] = max(_memory_stack[-1][1], peak)
+    else:
+        tracemalloc.stop()
+    return peak - start
+
+def timing_report() -> list[dict]:
+    """
+    Summarize TIMINGS with one row per stage
+
+    Returns:
+        A list of dictionaries (stage, calls, total_ms, mean_ms, max_ms,
+        peak_bytes), slowest stage first
+    """
+    rows = [{'stage': name,
+             'calls': entry['calls'],
+             'total_ms': entry['total_ns'] / 1e6,
+             'mean_ms': entry['total_ns'] / entry['calls'] / 1e6,
+             'max_ms': entry['max_ns'] / 1e6,
+             'peak_bytes': entry['peak_bytes']}
+            for name, entry in TIMINGS.items()]
+    return sorted(rows, key = lambda row: row['total_ms'], reverse = True)
+
+def dump_timings(path: str) -> None:
+    """
+    Write the timing report to a .json or .csv file
+
+    Args:
+        path (str): The path of the file (the format follows the extension)
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    rows = timing_report()
+    if path.endswith('.csv'):
+        with open(path, 'w', newline = '') as f:
+            writer = csv.DictWriter(f, fieldnames = ['stage', 'calls', 'total_ms', 'mean_ms',
+                                                     'max_ms', 'peak_bytes'])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent = 2)
+
+def dump_profiles(folder: str) -> list[str]:
+    """
+    Write every cProfile capture as a .prof file (readable with pstats)
+
+    Args:
+        folder (str): The folder for the .prof files
+
+    Returns:
+        The paths of the written files
+    """
+    os.makedirs(folder, exist_ok = True)
+    paths = []
+    for name, profiler in PROFILES.items():
+        path = os.path.join(folder, f'{name}.prof')
+        profiler.dump_stats(path)
+        paths.append(path)
+    return paths
+
+def reset_timings() -> None:
+    """
+    Clear TIMINGS & PROFILES
+    """
+    TIMINGS.clear()
+    PROFILES.clear()
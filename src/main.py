@@ -1,16 +1,26 @@
 import numpy as np
 # Import the initial number of decks
-from visualization import fill_heatmaps, initial_num_decks  
+from src.visualization import fill_heatmaps, initial_num_decks  
+from src.helpers import configure_instrumentation, dump_profiles, dump_timings
 
 # Number of additional decks to augment with
 seed = 43
 augment_decks = 100
+# Number of processes used for scoring
+workers = 1
 total_decks = initial_num_decks + augment_decks
 output_file = f'{total_decks}_decks_augmented'
+# Optionally record memory peaks & cProfile stages (e.g. {'src.processing.count_outcomes'})
+configure_instrumentation(memory = False, profile = set())
 
 # Create the new heatmaps
 fill_heatmaps(seed = seed, n_decks = initial_num_decks, 
-              augment_decks = augment_decks, output_file = output_file)
+              augment_decks = augment_decks, output_file = output_file, 
+              workers = workers)
+
+# Save where the run spent its time
+dump_timings(f'timings/timings_{output_file}.json')
+dump_profiles('timings')
 
 """
 Generate the augmented heatmaps by calling the fill_heatmaps function 
@@ -21,6 +31,7 @@ Args:
     n_decks (int): The number of initial decks
     augment_decks (int): The number of additional decks to augment
     output_file (str): The name for the file containing the new heatmaps
+    workers (int): The number of processes used for scoring
 
 Returns: 
     None
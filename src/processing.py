@@ -1,5 +1,25 @@
 import numpy as np
-from datagen import get_decks
+import json
+import os
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from statistics import NormalDist
+from src.cache import cache_lookup, cache_store
+from src.datagen import BLOCK_DECKS, HALF_DECK_SIZE, deck_block_loaders
+from src.helpers import PATH_DATA, timed
+
+# Default length of the sequences (see sequence_list)
+SEQUENCE_LENGTH = 3
+
+# Number of decks scored together by score_all_pairs
+CHUNK_SIZE = 20_000
+
+# Optional score distributions in the outcome counts (see empty_histograms)
+HISTOGRAM_KEYS = ('trick_histogram', 'margin_histogram')
+
+# Part of every cache key: bump it whenever the generated decks or the 
+# scoring rules change, so that older cached results are never reused
+ENGINE_VERSION = 2
 
 def sequence_to_binary(sequence: str
                        ) -> np.ndarray:
@@ -15,6 +35,60 @@ def sequence_to_binary(sequence: str
     # Convert characters into binary
     return np.array([0 if char == 'B' else 1 for char in sequence])  # 'B' = 0, 'R' = 1
 
+def sequence_list(length: int = SEQUENCE_LENGTH
+                  ) -> list:
+    """
+    Generate all possible sequences of 'length' cards, in code order
+
+    Args:
+        length (int): The length of the sequences
+
+    Returns:
+        A list of the 2 ** length sequences of 'B' & 'R'
+    """
+    return [format(i, f'0{length}b').replace('0', 'B').replace('1', 'R') 
+            for i in range(2 ** length)]
+
+def sequence_to_code(sequence) -> int:
+    """
+    Convert a sequence into its integer code (0-7 for 3 cards)
+
+    Args:
+        sequence: The sequence, either as a string of 'B' & 'R' 
+        or as binary 0s & 1s
+
+    Returns:
+        The integer whose binary digits are the sequence ('BRR' = 0b011 = 3)
+    """
+    if isinstance(sequence, str):
+        sequence = sequence_to_binary(sequence)
+    code = 0
+    for card in sequence:
+        code = (code << 1) | int(card)
+    return code
+
+def window_codes(decks: np.ndarray, 
+                 length: int = SEQUENCE_LENGTH
+                 ) -> np.ndarray:
+    """
+    Encode every sliding window of every deck as an integer 
+    (0-7 for 3-card windows)
+
+    Args:
+        decks (np.ndarray): 2D array of shape (n_decks, num_cards)
+        length (int): The number of cards in a window (at most 8)
+
+    Returns:
+        An array of shape (n_decks, num_cards - length + 1) where entry 
+        [d, w] is the code of cards w, ..., w + length - 1 of deck d
+    """
+    decks = np.asarray(decks, dtype = np.uint8)
+    n_windows = decks.shape[1] - length + 1
+    codes = np.zeros((len(decks), n_windows), dtype = np.uint8)
+    for offset in range(length):
+        codes = (codes << 1) | decks[:, offset:offset + n_windows]
+    return codes
+
 def play_game(deck: list, 
               p1_sequence: tuple, 
               p2_sequence: tuple
@@ -36,6 +110,7 @@ def play_game(deck: list,
     num_cards = 0
     # Holds the last sequence (three cards)
     last_sequence = []  
+    length = len(p1_sequence)
 
     # Go through each card in the deck
     for i in deck:
@@ -43,10 +118,10 @@ def play_game(deck: list,
         num_cards += 1
 
         # Ensure that last_sequence has no more than 3 cards
-        last_sequence = last_sequence[-3:]
+        last_sequence = last_sequence[-length:]
 
         # Check if the last 3 cards match player 1's sequence
-        if len(last_sequence) == 3:
+        if len(last_sequence) == length:
             if tuple(last_sequence) == p1_sequence:
                 tricks[0] += 1
                 p1_cards += num_cards
@@ -64,9 +139,685 @@ def play_game(deck: list,
 
     return {'tricks': tricks, 'p1_cards': p1_cards, 'p2_cards': p2_cards}
 
+def play_games(decks: np.ndarray, 
+               p1_sequence: tuple, 
+               p2_sequence: tuple
+               ) -> dict:
+    """
+    Simulate Penney's Game on a whole batch of shuffled decks at once
+
+    Every 3-card window of every deck is encoded as an integer (0-7), 
+    then the decks are swept one window at a time with the reset rule 
+    (a match clears the window, so the next match needs 3 new cards) 
+    applied as array operations. The results are identical to calling 
+    play_game on each deck.
+
+    Args:
+        decks (np.ndarray): 2D array of shape (n_decks, num_cards)
+        p1_seq (tuple): Player 1's sequence 
+        p2_seq (tuple): Player 2's sequence
+
+    Returns:
+        A dictionary containing the number of tricks (shape (n_decks, 2)) 
+        and cards (shape (n_decks,)) won by each player for every deck
+    """
+    length = len(p1_sequence)
+    codes = window_codes(decks, length)
+    p1_code = sequence_to_code(p1_sequence)
+    p2_code = sequence_to_code(p2_sequence)
+    n_decks, n_windows = codes.shape
+
+    tricks = np.zeros((n_decks, 2), dtype = np.int64)
+    p1_cards = np.zeros(n_decks, dtype = np.int64)
+    p2_cards = np.zeros(n_decks, dtype = np.int64)
+    # Position of the last card of the most recent match (-1 = none yet)
+    last_match = np.full(n_decks, -1, dtype = np.int64)
+
+    for w in range(n_windows):
+        # Window w ends on card w + 2 (for 3-card sequences)
+        position = w + length - 1
+        # A window only counts once 3 cards have been dealt since the reset
+        eligible = position - last_match >= length
+        p1_match = eligible & (codes[:, w] == p1_code)
+        # Player 1 is checked first, just like in play_game
+        p2_match = eligible & (codes[:, w] == p2_code) & ~p1_match
+
+        # Cards won are all of the cards dealt since the last match
+        num_cards = position - last_match
+        tricks[:, 0] += p1_match
+        tricks[:, 1] += p2_match
+        p1_cards += np.where(p1_match, num_cards, 0)
+        p2_cards += np.where(p2_match, num_cards, 0)
+        last_match = np.where(p1_match | p2_match, position, last_match)
+
+    return {'tricks': tricks, 'p1_cards': p1_cards, 'p2_cards': p2_cards}
+
+def compile_automaton(p1_sequence, 
+                      p2_sequence
+                      ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compile a pair of sequences into an Aho-Corasick style automaton
+
+    The states are the proper prefixes of either sequence: the longest 
+    run of cards since the last reset that could still start a match. 
+    Reaching a full sequence scores for its player (player 1 first) and 
+    sends the automaton back to the empty state, which is the reset rule.
+
+    Args:
+        p1_sequence: Player 1's sequence ('B' & 'R' or 0s & 1s)
+        p2_sequence: Player 2's sequence ('B' & 'R' or 0s & 1s)
+
+    Returns:
+        next_state (np.ndarray): Array of shape (n_states, 2) with the 
+        state after each card (state 0 is the empty window)
+        events (np.ndarray): Array of shape (n_states, 2) that is 1 if 
+        the card completes player 1's sequence, 2 for player 2's and 0 
+        otherwise
+    """
+    p1, p2 = (tuple(int(card) for card in (sequence_to_binary(seq) if isinstance(seq, str) else seq))
+              for seq in (p1_sequence, p2_sequence))
+    prefixes = sorted({seq[:k] for seq in (p1, p2) for k in range(len(seq))}, 
+                      key = lambda prefix: (len(prefix), prefix))
+    index = {prefix: state for state, prefix in enumerate(prefixes)}
+
+    next_state = np.zeros((len(prefixes), 2), dtype = np.int32)
+    events = np.zeros((len(prefixes), 2), dtype = np.int8)
+    for prefix, state in index.items():
+        for card in (0, 1):
+            cards = prefix + (card,)
+            if cards[-len(p1):] == p1:
+                events[state, card] = 1
+            elif cards[-len(p2):] == p2:
+                events[state, card] = 2
+            else:
+                # Fall back to the longest suffix that can still match
+                while cards not in index:
+                    cards = cards[1:]
+                next_state[state, card] = index[cards]
+    return next_state, events
+
+@timed()
+def score_all_pairs(decks: np.ndarray, 
+                    chunk_size: int = CHUNK_SIZE, 
+                    pairs: np.ndarray | None = None, 
+                    length: int = SEQUENCE_LENGTH, 
+                    histograms: bool = False
+                    ) -> dict:
+    """
+    Score every pair of sequences on a batch of decks in a single pass
+
+    For 3-card sequences, the window codes of each deck are computed once 
+    and shared by all 56 pairs of different sequences, so each deck is 
+    only scanned once instead of once per pair. Other lengths compile 
+    every pair into an automaton and score all of them by table lookup.
+
+    Args:
+        decks (np.ndarray): 2D array of shape (n_decks, num_cards)
+        chunk_size (int): The number of decks scored together (for 56 pairs)
+        pairs (np.ndarray): Optional (8, 8) boolean mask of the pairs to 
+        score (all of them if None), the other pairs are left at 0
+        length (int): The length of the sequences
+        histograms (bool): Also count the full distributions of the 
+        scores (see empty_histograms)
+
+    Returns:
+        A dictionary with the 'tricks' & 'cards' counts, each an integer 
+        array of shape (3, 8, 8) holding the number of decks where 
+        player 2 wins ([0]), draws ([1]) and loses ([2]) for 
+        player 1's sequence i & player 2's sequence j at [:, i, j], 
+        and 'n_decks', the number of decks scored (plus the 
+        'trick_histogram' & 'margin_histogram' if 'histograms')
+    """
+    decks = np.asarray(decks)
+    n_decks = len(decks)
+    n_sequences = 2 ** length
+
+    # Off-diagonal pairs (player 1 code, player 2 code)
+    if pairs is None:
+        pairs = np.ones((n_sequences, n_sequences), dtype = bool)
+    p1_codes, p2_codes = np.nonzero(pairs & ~np.eye(n_sequences, dtype = bool))
+    counts = empty_counts(length)
+    if histograms:
+        counts.update(empty_histograms(decks.shape[1], length))
+
+    score_chunk, chunk_size = _chunk_scorer(p1_codes, p2_codes, length, chunk_size, histograms)
+    for start in range(0, n_decks, chunk_size):
+        tricks_diff, cards_diff, n_tricks = score_chunk(decks[start:start + chunk_size])
+        for mode, diff in (('tricks', tricks_diff), ('cards', cards_diff)):
+            counts[mode][0, p1_codes, p2_codes] += np.sum(diff > 0, axis = 1)
+            counts[mode][1, p1_codes, p2_codes] += np.sum(diff == 0, axis = 1)
+            counts[mode][2, p1_codes, p2_codes] += np.sum(diff < 0, axis = 1)
+        if histograms:
+            _add_histograms(counts, p1_codes, p2_codes, tricks_diff, cards_diff, n_tricks)
+
+    # When sequences are the same -> draw
+    for mode in ('tricks', 'cards'):
+        counts[mode][1][np.eye(n_sequences, dtype = bool)] = n_decks
+    counts['n_decks'] = n_decks
+    return counts
+
+def _chunk_scorer(p1_codes: np.ndarray, 
+                  p2_codes: np.ndarray, 
+                  length: int = SEQUENCE_LENGTH, 
+                  chunk_size: int = CHUNK_SIZE, 
+                  totals: bool = False
+                  ) -> tuple:
+    """
+    Pick the leads function for the pairs & the number of decks it 
+    should score at once
+    """
+    if length == SEQUENCE_LENGTH:
+        return partial(_window_leads, p1_codes = p1_codes, p2_codes = p2_codes, 
+                       totals = totals), chunk_size
+    # Keep the (pair, deck) arrays about as big as for 56 pairs
+    return (partial(_automaton_leads, automata = _stack_automata(p1_codes, p2_codes, length), 
+                    totals = totals), 
+            max(1, chunk_size * 56 // max(len(p1_codes), 1)))
+
+def _window_leads(decks: np.ndarray, 
+                  p1_codes: np.ndarray, 
+                  p2_codes: np.ndarray, 
+                  totals: bool = False
+                  ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """
+    Player 2's lead in tricks/cards for every (pair, deck), from the 
+    3-card window codes, and the total number of tricks if 'totals'
+    """
+    codes = window_codes(decks)
+    n_chunk, n_windows = codes.shape
+
+    tricks_diff = np.zeros((len(p1_codes), n_chunk), dtype = np.int16)
+    cards_diff = np.zeros((len(p1_codes), n_chunk), dtype = np.int16)
+    last_match = np.full((len(p1_codes), n_chunk), -1, dtype = np.int16)
+    n_tricks = np.zeros((len(p1_codes), n_chunk), dtype = np.int16) if totals else None
+
+    for w in range(n_windows):
+        position = w + 2
+        eligible = position - last_match >= 3
+        p1_match = eligible & (codes[:, w] == p1_codes[:, None])
+        p2_match = eligible & (codes[:, w] == p2_codes[:, None])
+        # The sequences differ, so at most one player can match
+        sign = p2_match.astype(np.int16) - p1_match
+        tricks_diff += sign
+        cards_diff += sign * (position - last_match)
+        last_match[p1_match | p2_match] = position
+        if totals:
+            n_tricks += sign != 0
+    return tricks_diff, cards_diff, n_tricks
+
+def _stack_automata(p1_codes: np.ndarray, 
+                    p2_codes: np.ndarray, 
+                    length: int
+                    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compile every pair and stack the automata into flat lookup tables
+
+    Entry state * 2 + card of the tables holds the next state and the 
+    change in player 2's lead (-1, 0 or 1), where the states of pair p 
+    are numbered from p * n_states.
+
+    Returns:
+        The next states, the lead changes & the empty state of each pair
+    """
+    sequences = sequence_list(length)
+    automata = [compile_automaton(sequences[i], sequences[j]) for i, j in zip(p1_codes, p2_codes)]
+    n_states = max((len(next_state) for next_state, _ in automata), default = 1)
+    first_states = np.arange(len(automata), dtype = np.int32) * n_states
+
+    next_states = np.zeros((len(automata), n_states, 2), dtype = np.int32)
+    signs = np.zeros((len(automata), n_states, 2), dtype = np.int16)
+    for pair, (next_state, events) in enumerate(automata):
+        next_states[pair, :len(next_state)] = next_state + first_states[pair]
+        signs[pair, :len(events)] = np.array([0, -1, 1])[events]
+    return next_states.ravel(), signs.ravel(), first_states
+
+def _automaton_leads(decks: np.ndarray, 
+                     automata: tuple[np.ndarray, np.ndarray, np.ndarray], 
+                     totals: bool = False
+                     ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """
+    Player 2's lead in tricks/cards for every (pair, deck), by running 
+    the stacked automata from _stack_automata one card at a time, and 
+    the total number of tricks if 'totals'
+    """
+    next_states, signs, first_states = automata
+    decks = np.asarray(decks, dtype = np.int32)
+    n_chunk, num_cards = decks.shape
+
+    state = np.repeat(first_states[:, None], n_chunk, axis = 1)
+    tricks_diff = np.zeros(state.shape, dtype = np.int16)
+    cards_diff = np.zeros(state.shape, dtype = np.int16)
+    since_reset = np.zeros(state.shape, dtype = np.int16)
+    n_tricks = np.zeros(state.shape, dtype = np.int16) if totals else None
+
+    for card in range(num_cards):
+        entry = state * 2 + decks[:, card]
+        sign = signs[entry]
+        state = next_states[entry]
+        # Cards won are all of the cards dealt since the last match
+        since_reset += 1
+        tricks_diff += sign
+        cards_diff += sign * since_reset
+        since_reset[sign != 0] = 0
+        if totals:
+            n_tricks += sign != 0
+    return tricks_diff, cards_diff, n_tricks
+
+def empty_counts(length: int = SEQUENCE_LENGTH
+                 ) -> dict:
+    """
+    Create zeroed outcome counts in the format returned by score_all_pairs
+    """
+    n_sequences = 2 ** length
+    return {
+        'tricks': np.zeros((3, n_sequences, n_sequences), dtype = np.int64),
+        'cards': np.zeros((3, n_sequences, n_sequences), dtype = np.int64),
+        'n_decks': 0
+    }
+
+def empty_histograms(num_cards: int = 2 * HALF_DECK_SIZE, 
+                     length: int = SEQUENCE_LENGTH
+                     ) -> dict:
+    """
+    Create zeroed score histograms for every pair
+
+    Returns:
+        A dictionary with the 'trick_histogram' of shape (8, 8, T + 1, 
+        T + 1) counting the decks where player 1 won t1 tricks & player 2 
+        won t2 tricks at [i, j, t1, t2] (T = num_cards // length tricks 
+        at most), and the 'margin_histogram' of shape (8, 8, 2 * 
+        num_cards + 1) counting the decks where player 2 won m more cards 
+        than player 1 at [i, j, m + num_cards]
+    """
+    n_sequences = 2 ** length
+    max_tricks = num_cards // length
+    return {
+        'trick_histogram': np.zeros((n_sequences, n_sequences, max_tricks + 1, max_tricks + 1), 
+                                    dtype = np.int64),
+        'margin_histogram': np.zeros((n_sequences, n_sequences, 2 * num_cards + 1), 
+                                     dtype = np.int64)
+    }
+
+def _add_histograms(counts: dict, 
+                    p1_codes: np.ndarray, 
+                    p2_codes: np.ndarray, 
+                    tricks_diff: np.ndarray, 
+                    cards_diff: np.ndarray, 
+                    n_tricks: np.ndarray
+                    ) -> None:
+    """
+    Add the (pair, deck) scores of one chunk to the score histograms
+    """
+    n_pairs = len(p1_codes)
+    pair_index = np.arange(n_pairs)[:, None]
+    trick_bins = counts['trick_histogram'].shape[-1]
+    margin_bins = counts['margin_histogram'].shape[-1]
+
+    p2_tricks = (n_tricks + tricks_diff) // 2
+    p1_tricks = n_tricks - p2_tricks
+    flat = (pair_index * trick_bins + p1_tricks) * trick_bins + p2_tricks
+    counts['trick_histogram'][p1_codes, p2_codes] += np.bincount(
+        flat.ravel(), minlength = n_pairs * trick_bins**2).reshape(n_pairs, trick_bins, trick_bins)
+
+    flat = pair_index * margin_bins + cards_diff + margin_bins // 2
+    counts['margin_histogram'][p1_codes, p2_codes] += np.bincount(
+        flat.ravel(), minlength = n_pairs * margin_bins).reshape(n_pairs, margin_bins)
+
+def merge_counts(counts: dict, 
+                 other: dict
+                 ) -> dict:
+    """
+    Add two sets of outcome counts from disjoint batches of decks
+
+    Args:
+        counts (dict): Outcome counts from score_all_pairs
+        other (dict): More outcome counts from score_all_pairs
+
+    Returns:
+        The combined outcome counts (with the provenance of both, if known)
+    """
+    merged = {
+        'tricks': counts['tricks'] + other['tricks'],
+        'cards': counts['cards'] + other['cards'],
+        'n_decks': counts['n_decks'] + other['n_decks']
+    }
+    if 'provenance' in counts or 'provenance' in other:
+        merged['provenance'] = counts.get('provenance', []) + other.get('provenance', [])
+    # Histograms are only kept while they cover every deck
+    for key in HISTOGRAM_KEYS:
+        if key in counts and key in other:
+            merged[key] = counts[key] + other[key]
+        elif key in counts and not np.any(other['n_decks']):
+            merged[key] = counts[key]
+        elif key in other and not np.any(counts['n_decks']):
+            merged[key] = other[key]
+    return merged
+
+def deck_provenance(n_decks: int, 
+                    seed: int | None, 
+                    stream: str = 'blocks', 
+                    length: int = SEQUENCE_LENGTH, 
+                    half_deck_size: int = HALF_DECK_SIZE, 
+                    first_block: int = 0, 
+                    **details
+                    ) -> dict:
+    """
+    Describe where the decks behind some counts came from
+
+    Args:
+        n_decks (int): The number of decks
+        seed (int): The seed of the decks (None if unknown)
+        stream (str): How the decks were generated from the seed: 
+        'blocks' (datagen.deck_block_loaders), 'store' (a deck store 
+        chunk) or 'legacy' (the older per-deck seeds)
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color
+        first_block (int): The first block of the seed's stream used 
+        (for 'blocks', see datagen.next_free_block)
+        details: Anything else worth recording (e.g. the source file)
+
+    Returns:
+        A provenance entry, as stored in counts['provenance']
+    """
+    entry = {'seed': seed, 'n_decks': n_decks, 'stream': stream, 
+             'length': length, 'half_deck_size': half_deck_size}
+    if stream == 'blocks':
+        # The same seed & blocks give different decks under another generator
+        entry.update(first_block = first_block, block_decks = BLOCK_DECKS, 
+                     engine_version = ENGINE_VERSION)
+    return {**entry, **details}
+
+def count_arrays(counts: dict
+                 ) -> dict:
+    """
+    Collect the arrays of outcome counts for saving
+
+    The outcome counts stay int64 counters, the (much larger) score 
+    histograms are stored as int32.
+
+    Args:
+        counts (dict): Outcome counts from score_all_pairs
+
+    Returns:
+        A dictionary of the 'tricks', 'cards', 'n_decks' & histogram arrays
+    """
+    arrays = {'tricks': counts['tricks'], 'cards': counts['cards'], 'n_decks': counts['n_decks']}
+    for key in HISTOGRAM_KEYS:
+        if key in counts:
+            if counts[key].max(initial = 0) > np.iinfo(np.int32).max:
+                raise OverflowError(f'The {key} does not fit in int32')
+            arrays[key] = counts[key].astype(np.int32)
+    return arrays
+
+def save_counts(counts: dict, 
+                filename: str
+                ) -> None:
+    """
+    Save outcome counts (see count_arrays) in the probability_data folder
+
+    Args:
+        counts (dict): Outcome counts from score_all_pairs, with an 
+        optional 'provenance' list (saved as JSON)
+        filename (str): The name of the .npz file
+    """
+    os.makedirs(PATH_DATA, exist_ok = True)
+    extra = {}
+    if 'provenance' in counts:
+        extra['provenance'] = np.array(json.dumps(counts['provenance']))
+    np.savez(os.path.join(PATH_DATA, filename), **count_arrays(counts), **extra)
+
+def load_counts(filename: str
+                ) -> dict:
+    """
+    Load outcome counts saved by save_counts
+
+    Args:
+        filename (str): The name of the .npz file
+
+    Returns:
+        The outcome counts, in the format returned by score_all_pairs
+    """
+    with np.load(os.path.join(PATH_DATA, filename)) as data:
+        n_decks = data['n_decks']
+        counts = {'tricks': data['tricks'].astype(np.int64), 
+                  'cards': data['cards'].astype(np.int64), 
+                  # Per-pair deck counts (from adaptive_outcomes) are arrays
+                  'n_decks': int(n_decks) if n_decks.ndim == 0 else n_decks.astype(np.int64)}
+        for key in HISTOGRAM_KEYS:
+            if key in data.files:
+                counts[key] = data[key].astype(np.int64)
+        if 'provenance' in data.files:
+            counts['provenance'] = json.loads(str(data['provenance']))
+    return counts
+
+def counts_from_probabilities(cards_data: np.ndarray, 
+                              tricks_data: np.ndarray, 
+                              n_decks: int
+                              ) -> dict:
+    """
+    Recover the outcome counts behind stored (2, 8, 8) probability arrays
+
+    The older probability_data files store count / n_decks, so the counts 
+    are recovered exactly by rounding (losses are the remaining decks).
+
+    Args:
+        cards_data (np.ndarray): Win/draw probabilities by cards
+        tricks_data (np.ndarray): Win/draw probabilities by tricks
+        n_decks (int): The number of decks behind the probabilities
+
+    Returns:
+        The outcome counts, in the format returned by score_all_pairs
+    """
+    counts = {'n_decks': n_decks}
+    for mode, data in (('tricks', tricks_data), ('cards', cards_data)):
+        win_draw = np.rint(np.asarray(data) * n_decks).astype(np.int64)
+        counts[mode] = np.concatenate((win_draw, n_decks - win_draw.sum(axis = 0, keepdims = True)))
+    return counts
+
+def deck_sources(decks = None, 
+                 n_decks: int | None = None, 
+                 seed: int = 0, 
+                 chunk_size: int = CHUNK_SIZE, 
+                 half_deck_size: int = HALF_DECK_SIZE, 
+                 first_block: int = 0
+                 ):
+    """
+    Split any of the supported deck sources into independent pieces
+
+    Args:
+        decks: Either None (generate 'n_decks' decks from 'seed'), a 2D 
+        array of decks, a loader (a function that returns the decks) or 
+        an iterable of deck chunks/loaders such as datagen.stream_decks
+        n_decks (int): The number of decks to use (all of them if None)
+        seed (int): The seed used when generating the decks
+        chunk_size (int): The number of decks per chunk for 2D arrays
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        first_block (int): The first block of the seed's stream when 
+        generating the decks
+
+    Returns:
+        An iterable of 2D deck arrays and/or loaders returning them
+
+    Raises:
+        ValueError: If there are neither decks nor a number of decks to 
+        generate
+    """
+    if decks is None:
+        if n_decks is None:
+            raise ValueError('Either the decks or the number of decks to generate (n_decks) '
+                             'must be given')
+        return deck_block_loaders(n_decks = n_decks, seed = seed, 
+                                  half_deck_size = half_deck_size, first_block = first_block)
+    if callable(decks):
+        decks = decks()
+    if isinstance(decks, np.ndarray):
+        decks = decks[:n_decks]
+        return [decks[start:start + chunk_size] for start in range(0, len(decks), chunk_size)]
+    return decks
+
+def iter_deck_chunks(decks = None, 
+                     n_decks: int | None = None, 
+                     seed: int = 0, 
+                     chunk_size: int = CHUNK_SIZE, 
+                     half_deck_size: int = HALF_DECK_SIZE, 
+                     first_block: int = 0
+                     ):
+    """
+    Stream decks in chunks from any of the supported deck sources
+
+    Args:
+        decks: Either None (generate 'n_decks' decks from 'seed'), a 2D 
+        array of decks, a loader (a function that returns the decks) or 
+        an iterable of deck chunks/loaders such as datagen.stream_decks
+        n_decks (int): The number of decks to use (all of them if None)
+        seed (int): The seed used when generating the decks
+        chunk_size (int): The number of decks per chunk for 2D arrays
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        first_block (int): The first block of the seed's stream when 
+        generating the decks
+
+    Yields:
+        2D arrays of shape (chunk, num_cards)
+    """
+    remaining = n_decks
+    for chunk in deck_sources(decks, n_decks = n_decks, seed = seed, chunk_size = chunk_size, 
+                              half_deck_size = half_deck_size, first_block = first_block):
+        if callable(chunk):
+            chunk = chunk()
+        # Stop once 'n_decks' decks have been used
+        if remaining is not None:
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+        if len(chunk):
+            yield np.asarray(chunk)
+        if remaining == 0:
+            break
+
+def probability_arrays(counts: dict, 
+                       n_decks: int | None = None
+                       ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Turn the outcome counts from score_all_pairs into the heatmap arrays
+
+    Args:
+        counts (dict): The outcome counts from score_all_pairs
+        n_decks (int | np.ndarray): The number of decks that were scored, 
+        either overall or per pair (counts['n_decks'] if None)
+
+    Returns:
+        cards_data (np.ndarray): Array of shape (2, 8, 8) with player 2's 
+        win ([0]) & draw ([1]) probabilities by cards
+        tricks_data (np.ndarray): The same array for tricks
+    """
+    if n_decks is None:
+        n_decks = counts['n_decks']
+    cards_data = counts['cards'][:2] / n_decks
+    tricks_data = counts['tricks'][:2] / n_decks
+    return cards_data, tricks_data
+
+def margin_distribution(counts: dict,
+                        mode: str = 'cards'
+                        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Distribution of player 2's winning margin for every pair, from the
+    score histograms (see empty_histograms)
+
+    Args:
+        counts (dict): Outcome counts with histograms (histograms = True)
+        mode (str): 'tricks' or 'cards'
+
+    Returns:
+        margins (np.ndarray): Player 2's possible leads over player 1
+        probabilities (np.ndarray): Array of shape (8, 8, len(margins))
+        with the probability of each lead for pair [i, j] (all 0 on the
+        diagonal, which is never scored)
+    """
+    if mode == 'cards':
+        histogram = counts['margin_histogram']
+        num_cards = histogram.shape[-1] // 2
+        margins = np.arange(-num_cards, num_cards + 1)
+    elif mode == 'tricks':
+        trick_histogram = counts['trick_histogram']
+        max_tricks = trick_histogram.shape[-1] - 1
+        # Add up the (t1, t2) cells along each diagonal t2 - t1 = margin
+        lead = np.subtract.outer(np.arange(max_tricks + 1), np.arange(max_tricks + 1)).T
+        margins = np.arange(-max_tricks, max_tricks + 1)
+        histogram = np.zeros(trick_histogram.shape[:2] + (len(margins),), dtype = np.int64)
+        for k, margin in enumerate(margins):
+            histogram[..., k] = trick_histogram[..., lead == margin].sum(axis = -1)
+    else:
+        raise ValueError(f"mode must be 'tricks' or 'cards', not {mode!r}")
+
+    n_decks = np.asarray(counts['n_decks'])
+    if n_decks.ndim:
+        n_decks = n_decks[..., None]
+    return margins, histogram / n_decks
+
+def margin_moments(counts: dict,
+                   mode: str = 'cards'
+                   ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expected value & variance of player 2's winning margin for every pair
+
+    Args:
+        counts (dict): Outcome counts with histograms (histograms = True)
+        mode (str): 'tricks' or 'cards'
+
+    Returns:
+        The mean & variance arrays of shape (8, 8)
+    """
+    margins, probabilities = margin_distribution(counts, mode)
+    mean = probabilities @ margins
+    variance = probabilities @ margins**2 - mean**2
+    return mean, np.maximum(variance, 0)
+
+def tail_probability(counts: dict,
+                     threshold: int,
+                     mode: str = 'cards',
+                     upper: bool = True
+                     ) -> np.ndarray:
+    """
+    Probability that player 2's winning margin reaches a threshold
+
+    Args:
+        counts (dict): Outcome counts with histograms (histograms = True)
+        threshold (int): The margin (player 2's lead) to reach
+        mode (str): 'tricks' or 'cards'
+        upper (bool): P(margin >= threshold) if True, else
+        P(margin <= threshold)
+
+    Returns:
+        Array of shape (8, 8) with the probability for every pair
+    """
+    margins, probabilities = margin_distribution(counts, mode)
+    tail = margins >= threshold if upper else margins <= threshold
+    return probabilities[..., tail].sum(axis = -1)
+
+def expected_tricks(counts: dict
+                    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expected number of tricks won by each player for every pair
+
+    Args:
+        counts (dict): Outcome counts with histograms (histograms = True)
+
+    Returns:
+        The arrays of shape (8, 8) of player 1's & player 2's expected tricks
+    """
+    histogram = counts['trick_histogram']
+    tricks = np.arange(histogram.shape[-1])
+    n_decks = np.asarray(counts['n_decks'], dtype = float)
+    p1_tricks = histogram.sum(axis = 3) @ tricks / n_decks
+    p2_tricks = histogram.sum(axis = 2) @ tricks / n_decks
+    return p1_tricks, p2_tricks
+
 def penneys_game(p1_sequence: str, 
                  p2_sequence: str, 
-                 n_decks: int
+                 n_decks: int | None = None, 
+                 decks = None, 
+                 seed: int = 0
                  ) -> dict:
     """
     Player 1 & player 2 each choose sequences of 3 cards, 
@@ -76,6 +827,9 @@ def penneys_game(p1_sequence: str,
         p1_sequence (str): First player's sequence
         p2_sequence (str): Second player's sequence
         n_decks (int): The number of shuffled decks
+        decks: Pre-generated decks, a loader or a stream of chunks 
+        (see iter_deck_chunks), generated from 'seed' if None
+        seed (int): The seed used when generating the decks
 
     Returns:
         A dictionary with player 2's win/loss/draw probabilities
@@ -85,38 +839,31 @@ def penneys_game(p1_sequence: str,
     p2_seq_binary = sequence_to_binary(p2_sequence)
 
     # Initialize counters
-    p1_wins_tricks, p2_wins_tricks, draws_tricks = 0, 0, 0
-    p1_wins_cards, p2_wins_cards, draws_cards = 0, 0, 0
-
-    for i in range(n_decks):
-        # Generate shuffled decks
-        deck = get_decks(n_decks = 1, seed = i)[0].tolist()
+    p1_wins_tricks, p2_wins_tricks = 0, 0
+    p1_wins_cards, p2_wins_cards = 0, 0
+    total_decks = 0
 
-        # Play the game using play_game()
-        win_stats = play_game(deck, tuple(p1_seq_binary), tuple(p2_seq_binary))
+    for chunk in iter_deck_chunks(decks, n_decks = n_decks, seed = seed):
+        # Play every game in the chunk at once using play_games()
+        win_stats = play_games(chunk, tuple(p1_seq_binary), tuple(p2_seq_binary))
+        p1_tricks, p2_tricks = win_stats['tricks'][:, 0], win_stats['tricks'][:, 1]
+        total_decks += len(chunk)
 
         # Score based on tricks
-        if win_stats['tricks'][0] > win_stats['tricks'][1]:
-            p1_wins_tricks += 1
-        elif win_stats['tricks'][1] > win_stats['tricks'][0]:
-            p2_wins_tricks += 1
-        else:
-            draws_tricks += 1
+        p1_wins_tricks += int(np.sum(p1_tricks > p2_tricks))
+        p2_wins_tricks += int(np.sum(p2_tricks > p1_tricks))
 
         # Score based on cards
-        if win_stats['p1_cards'] > win_stats['p2_cards']:
-            p1_wins_cards += 1
-        elif win_stats['p2_cards'] > win_stats['p1_cards']:
-            p2_wins_cards += 1
-        else:
-            draws_cards += 1
+        p1_wins_cards += int(np.sum(win_stats['p1_cards'] > win_stats['p2_cards']))
+        p2_wins_cards += int(np.sum(win_stats['p2_cards'] > win_stats['p1_cards']))
 
-    total_decks = n_decks
+    draws_tricks = total_decks - p1_wins_tricks - p2_wins_tricks
+    draws_cards = total_decks - p1_wins_cards - p2_wins_cards
 
     # When sequences are the same -> draw
     if p1_sequence == p2_sequence:
-      p1_wins_tricks, p2_wins_tricks, draws_tricks = 0, 0, n_decks
-      p1_wins_cards, p2_wins_cards, draws_cards = 0, 0, n_decks
+      p1_wins_tricks, p2_wins_tricks, draws_tricks = 0, 0, total_decks
+      p1_wins_cards, p2_wins_cards, draws_cards = 0, 0, total_decks
 
     # Return the probabilties for tricks/total cards
     return {
@@ -136,7 +883,15 @@ def penneys_game(p1_sequence: str,
         }
     }
 
-def calculate_win_probabilities(n_decks: int
+@timed()
+def calculate_win_probabilities(n_decks: int | None = None, 
+                                decks = None, 
+                                seed: int = 0, 
+                                workers: int = 1, 
+                                exact: bool = False, 
+                                length: int = SEQUENCE_LENGTH, 
+                                half_deck_size: int = HALF_DECK_SIZE, 
+                                use_cache: bool = False
                                 ) -> dict:
     """
     Calculate player 2's probabilities of winning/lossing/drawing 
@@ -144,21 +899,624 @@ def calculate_win_probabilities(n_decks: int
 
     Args:
         n_decks: The number of shuffled decks
+        decks: Pre-generated decks, a loader or a stream of chunks 
+        (see iter_deck_chunks), generated from 'seed' if None
+        seed (int): The seed used when generating the decks
+        workers (int): The number of processes used for scoring
+        exact (bool): Compute the exact probabilities with 
+        exact_probabilities instead of sampling decks
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color 
+        (26 per pack of cards)
+        use_cache (bool): Look the counts up in the results cache before 
+        computing them (see count_outcomes)
 
     Returns:
         A dictionary of win/loss/draw probabilities for each pair of sequences
     """
-    # Define all possible sequences of length 3 ('B' or 'R')
-    sequence_list = ['BBB', 'BBR', 'BRB', 'BRR', 'RBB', 'RBR', 'RRB', 'RRR']
+    if exact and use_cache:
+        params = {'engine': 'exact', 'length': length, 'half_deck_size': half_deck_size}
+        counts = cached_counts(params, partial(exact_probabilities, half_deck_size, length))
+    elif exact:
+        counts = exact_probabilities(half_deck_size = half_deck_size, length = length)
+    else:
+        counts = count_outcomes(n_decks = n_decks, decks = decks, seed = seed, workers = workers, 
+                                length = length, half_deck_size = half_deck_size, 
+                                use_cache = use_cache)
+    n_decks = counts['n_decks']
+    sequences = sequence_list(length)
 
     probabilities = {}
-    for p1_sequence in sequence_list:
-        for p2_sequence in sequence_list:
-            # Find the probability for each sequence pair
-            result = penneys_game(p1_sequence, p2_sequence, n_decks = n_decks)
+    for i, p1_sequence in enumerate(sequences):
+        for j, p2_sequence in enumerate(sequences):
             probabilities[(p1_sequence, p2_sequence)] = {
                 # Return tricks and total cards win probabilities 
-                'tricks': result['tricks'], 
-                'cards': result['cards']    
+                'tricks': _pair_probabilities(counts['tricks'], i, j, n_decks),
+                'cards': _pair_probabilities(counts['cards'], i, j, n_decks)
             }
-    return probabilities
\ No newline at end of file
+    return probabilities
+
+@timed()
+def count_outcomes(n_decks: int | None = None, 
+                   decks = None, 
+                   seed: int = 0, 
+                   workers: int = 1, 
+                   length: int = SEQUENCE_LENGTH, 
+                   half_deck_size: int = HALF_DECK_SIZE, 
+                   use_cache: bool = False, 
+                   first_block: int = 0, 
+                   histograms: bool = False
+                   ) -> dict:
+    """
+    Count player 2's wins/draws/losses for all possible sequences
+
+    Each deck is generated (or loaded) once and scored for every pair. 
+    With several workers the pieces of the deck source (the seeded 
+    blocks from datagen.deck_block_loaders when generating) are scored 
+    in separate processes and their integer counts are added up, so the 
+    result is identical for any number of workers.
+
+    Counts of generated decks are fully determined by the seed, the 
+    number of decks, the rules & ENGINE_VERSION, so with 'use_cache' 
+    they are looked up in the results cache (see cache.py) first and 
+    stored there after computing them.
+
+    Args:
+        n_decks: The number of shuffled decks
+        decks: Pre-generated decks, a loader or a stream of chunks 
+        (see iter_deck_chunks), generated from 'seed' if None
+        seed (int): The seed used when generating the decks
+        workers (int): The number of processes used for scoring
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        use_cache (bool): Look the counts up in the results cache before 
+        computing them (only for generated decks)
+        first_block (int): The first block of the seed's stream when 
+        generating the decks (see datagen.next_free_block)
+        histograms (bool): Also count the score histograms (see 
+        empty_histograms)
+
+    Returns:
+        The outcome counts from score_all_pairs
+    """
+    if use_cache:
+        if decks is not None:
+            raise ValueError('Only the counts of generated decks (decks = None) can be cached')
+        params = {'engine': 'simulation', 'n_decks': n_decks, 'seed': seed, 
+                  'first_block': first_block, 'length': length, 
+                  'half_deck_size': half_deck_size, 'block_decks': BLOCK_DECKS, 
+                  'bit_generator': 'PCG64', 'histograms': histograms}
+        counts = cached_counts(params, partial(count_outcomes, n_decks = n_decks, seed = seed, 
+                                               workers = workers, length = length, 
+                                               half_deck_size = half_deck_size, 
+                                               first_block = first_block, 
+                                               histograms = histograms))
+        return _with_provenance(counts, decks, seed, length, half_deck_size, first_block)
+
+    counts = empty_counts(length)
+    if workers <= 1:
+        for chunk in iter_deck_chunks(decks, n_decks = n_decks, seed = seed, 
+                                      half_deck_size = half_deck_size, first_block = first_block):
+            counts = merge_counts(counts, score_all_pairs(chunk, length = length, 
+                                                          histograms = histograms))
+        return _with_provenance(counts, decks, seed, length, half_deck_size, first_block)
+
+    if decks is None or isinstance(decks, np.ndarray) or n_decks is None:
+        sources = deck_sources(decks, n_decks = n_decks, seed = seed, 
+                               half_deck_size = half_deck_size, first_block = first_block)
+    else:
+        # Only the parent process can tell where 'n_decks' decks end
+        sources = iter_deck_chunks(decks, n_decks = n_decks, seed = seed)
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = set()
+        for source in sources:
+            pending.add(executor.submit(_score_source, source, length, histograms))
+            # Keep a bounded number of pieces in flight
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    counts = merge_counts(counts, future.result())
+        for future in pending:
+            counts = merge_counts(counts, future.result())
+    return _with_provenance(counts, decks, seed, length, half_deck_size, first_block)
+
+def _with_provenance(counts: dict, 
+                     decks, 
+                     seed: int, 
+                     length: int, 
+                     half_deck_size: int, 
+                     first_block: int
+                     ) -> dict:
+    """
+    Record the seed & blocks of generated decks in their counts
+    """
+    if decks is None:
+        counts['provenance'] = [deck_provenance(counts['n_decks'], seed, length = length, 
+                                                half_deck_size = half_deck_size, 
+                                                first_block = first_block)]
+    return counts
+
+def cached_counts(params: dict, 
+                  compute
+                  ) -> dict:
+    """
+    Get outcome counts from the results cache, computing them on a miss
+
+    Args:
+        params (dict): Everything that determines the counts 
+        (ENGINE_VERSION is added to it)
+        compute: A function with no arguments returning the counts
+
+    Returns:
+        The outcome counts, in the format returned by score_all_pairs
+    """
+    params = {**params, 'engine_version': ENGINE_VERSION}
+    cached = cache_lookup(params)
+    if cached is not None:
+        n_decks = cached.pop('n_decks')
+        # Widen the int32 histograms back to int64 counters, but keep the 
+        # float probabilities of the exact engine as they are
+        counts = {key: array.astype(np.int64) if np.issubdtype(array.dtype, np.integer) else array 
+                  for key, array in cached.items()}
+        counts['n_decks'] = int(n_decks) if n_decks.ndim == 0 else n_decks
+        return counts
+
+    counts = compute()
+    cache_store(params, count_arrays(counts))
+    return counts
+
+def checkpointed_outcomes(n_decks: int, 
+                          checkpoint_file: str, 
+                          seed: int = 0, 
+                          workers: int = 1, 
+                          batch_decks: int = 20 * BLOCK_DECKS, 
+                          length: int = SEQUENCE_LENGTH, 
+                          half_deck_size: int = HALF_DECK_SIZE, 
+                          first_block: int = 0, 
+                          histograms: bool = False
+                          ) -> dict:
+    """
+    Count the outcomes of 'n_decks' generated decks, saving a checkpoint 
+    of the counts after every batch
+
+    The decks are the seeded blocks from datagen.deck_block_loaders, so 
+    a run resumed from its checkpoint (even with a different number of 
+    workers or batch size) gives exactly the counts of count_outcomes.
+
+    Args:
+        n_decks (int): The number of shuffled decks
+        checkpoint_file (str): The name of the checkpoint .npz file (in 
+        the probability_data folder), resumed from if it exists
+        seed (int): The seed used when generating the decks
+        workers (int): The number of processes used for scoring
+        batch_decks (int): The number of decks scored between checkpoints 
+        (rounded to whole blocks of BLOCK_DECKS)
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        first_block (int): The first block of the seed's stream 
+        (see datagen.next_free_block)
+        histograms (bool): Also count the score histograms (see 
+        empty_histograms)
+
+    Returns:
+        The outcome counts from score_all_pairs
+    """
+    run = {'seed': seed, 'first_block': first_block, 'target_decks': n_decks, 
+           'length': length, 'half_deck_size': half_deck_size, 'block_decks': BLOCK_DECKS, 
+           'histograms': histograms}
+    checkpoint_path = os.path.join(PATH_DATA, checkpoint_file)
+    counts = empty_counts(length)
+    if os.path.exists(checkpoint_path):
+        with np.load(checkpoint_path) as data:
+            if any(key not in data.files or int(data[key]) != value for key, value in run.items()):
+                raise ValueError(f'{checkpoint_file} belongs to a different run')
+        counts = load_counts(checkpoint_file)
+        print(f'Resuming from {counts["n_decks"]:,} of {n_decks:,} decks')
+
+    loaders = deck_block_loaders(n_decks = n_decks, seed = seed, half_deck_size = half_deck_size, 
+                                 first_block = first_block)
+    blocks_per_batch = max(1, batch_decks // BLOCK_DECKS)
+    # Only the last block can be partial, so the finished blocks are 
+    # the deck count rounded up
+    for first in range(-(-counts['n_decks'] // BLOCK_DECKS), len(loaders), blocks_per_batch):
+        batch = count_outcomes(decks = loaders[first:first + blocks_per_batch], 
+                               workers = workers, length = length, histograms = histograms)
+        counts = merge_counts(counts, batch)
+
+        # Write the checkpoint to a temporary file first so that an 
+        # interrupted write never replaces the previous checkpoint
+        os.makedirs(PATH_DATA, exist_ok = True)
+        with open(checkpoint_path + '.tmp', 'wb') as f:
+            np.savez(f, **count_arrays(counts), **run)
+        os.replace(checkpoint_path + '.tmp', checkpoint_path)
+        print(f'Checkpoint: {counts["n_decks"]:,} of {n_decks:,} decks')
+    counts['provenance'] = [deck_provenance(n_decks, seed, length = length, 
+                                            half_deck_size = half_deck_size, 
+                                            first_block = first_block)]
+    return counts
+
+def _score_source(source, 
+                  length: int = SEQUENCE_LENGTH, 
+                  histograms: bool = False
+                  ) -> dict:
+    """
+    Score one piece of a deck source (run inside a worker process)
+    """
+    if callable(source):
+        source = source()
+    return score_all_pairs(np.asarray(source), length = length, histograms = histograms)
+
+def confidence_interval(successes, 
+                        n_decks, 
+                        confidence: float = 0.95
+                        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Wilson score interval for a probability estimated from deck counts
+
+    Unlike the normal approximation, the interval does not collapse to 
+    zero width for probabilities near 0 or 1 (e.g. BBB vs RBB).
+
+    Args:
+        successes: The number of decks with the outcome (scalar or array)
+        n_decks: The number of decks scored (scalar or array)
+        confidence (float): The confidence level of the interval
+
+    Returns:
+        The lower & upper bounds of the interval
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = np.maximum(np.asarray(n_decks, dtype = float), 1)
+    p = np.asarray(successes) / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return center - half_width, center + half_width
+
+def adaptive_outcomes(tolerance: float, 
+                      confidence: float = 0.95, 
+                      seed: int = 0, 
+                      batch_decks: int = BLOCK_DECKS, 
+                      max_decks: int = 10_000_000, 
+                      length: int = SEQUENCE_LENGTH, 
+                      half_deck_size: int = HALF_DECK_SIZE, 
+                      first_block: int = 0
+                      ) -> dict:
+    """
+    Simulate in batches until every pair's probabilities are precise enough
+
+    Each batch is scored only for the pairs that are still running. A pair 
+    stops once the confidence intervals of player 2's win & draw 
+    probabilities (by tricks & by cards) are all narrower than 
+    'tolerance', so decks go to the close pairs that need them.
+
+    Args:
+        tolerance (float): The widest allowed confidence interval
+        confidence (float): The confidence level of the intervals
+        seed (int): The seed used when generating the decks
+        batch_decks (int): The number of decks per batch
+        max_decks (int): The most decks any pair is scored on
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        first_block (int): The first block of the seed's stream (see 
+        datagen.next_free_block)
+
+    Returns:
+        The outcome counts from score_all_pairs, with 'n_decks' an 
+        (8, 8) array holding the number of decks each pair used, & the 
+        'provenance' of every deck generated
+    """
+    n_sequences = 2 ** length
+    counts = empty_counts(length)
+    counts['n_decks'] = np.zeros((n_sequences, n_sequences), dtype = np.int64)
+    running = ~np.eye(n_sequences, dtype = bool)
+
+    for loader in deck_block_loaders(n_decks = max_decks, seed = seed, block_decks = batch_decks, 
+                                     half_deck_size = half_deck_size, first_block = first_block):
+        decks = loader()
+        batch = score_all_pairs(decks, pairs = running, length = length)
+        # Per-pair deck counts are tracked separately below
+        batch['n_decks'] = 0
+        counts = merge_counts(counts, batch)
+        # The diagonal is always a draw, so it takes every deck for free
+        counts['n_decks'][running | np.eye(n_sequences, dtype = bool)] += len(decks)
+
+        # Stop the pairs whose intervals are all narrow enough
+        widths = []
+        for mode in ('tricks', 'cards'):
+            for outcome in (0, 1):
+                low, high = confidence_interval(counts[mode][outcome], counts['n_decks'], confidence)
+                widths.append(high - low)
+        running &= np.max(widths, axis = 0) >= tolerance
+        if not running.any():
+            break
+    # The diagonal counts every deck generated
+    counts['provenance'] = [deck_provenance(int(counts['n_decks'].max()), seed, length = length, 
+                                            half_deck_size = half_deck_size, 
+                                            first_block = first_block, block_decks = batch_decks)]
+    return counts
+
+@timed()
+def antithetic_outcomes(n_decks: int | None = None, 
+                        decks = None, 
+                        seed: int = 0, 
+                        reverse: bool = False, 
+                        length: int = SEQUENCE_LENGTH, 
+                        half_deck_size: int = HALF_DECK_SIZE, 
+                        first_block: int = 0
+                        ) -> dict:
+    """
+    Count the outcomes of every deck together with its color complement 
+    (and optionally their reverses)
+
+    Swapping black & red turns a match of sequence i into a match of 
+    sequence 7 - i, so the complement of a deck scores pair (i, j) exactly 
+    like the deck itself scores the mirrored pair (7 - i, 7 - j): the 
+    complements cost nothing to score, & mirrored cells share all of their 
+    samples. The reversed decks are scored separately.
+
+    Args:
+        n_decks: The number of shuffled decks
+        decks: Pre-generated decks, a loader or a stream of chunks 
+        (see iter_deck_chunks), generated from 'seed' if None
+        seed (int): The seed used when generating the decks
+        reverse (bool): Also score the reverse of every deck (& of its 
+        complement)
+        length (int): The length of the sequences
+        half_deck_size (int): The number of cards of each color when 
+        generating the decks (26 per pack of cards)
+        first_block (int): The first block of the seed's stream when 
+        generating the decks (see datagen.next_free_block)
+
+    Returns:
+        The outcome counts from score_all_pairs, counting each group of 
+        2 (4 with 'reverse') related decks as that many samples, plus the 
+        'variance_reduction' of each mode: an array of shape (3, 8, 8) 
+        with the variance of count_outcomes' estimates divided by the 
+        variance of these estimates for the same number of generated 
+        decks, i.e. how many times fewer decks are needed for the same 
+        confidence (nan on the diagonal)
+    """
+    n_sequences = 2 ** length
+    p1_codes, p2_codes = np.nonzero(~np.eye(n_sequences, dtype = bool))
+    pair_index = np.zeros((n_sequences, n_sequences), dtype = np.int64)
+    pair_index[p1_codes, p2_codes] = np.arange(len(p1_codes))
+    mirror = pair_index[n_sequences - 1 - p1_codes, n_sequences - 1 - p2_codes]
+    score_chunk, chunk_size = _chunk_scorer(p1_codes, p2_codes, length)
+    group_size = 4 if reverse else 2
+
+    counts = empty_counts(length)
+    # Sum of the squared number of decks with each outcome in each group
+    squares = empty_counts(length)
+    n_groups = 0
+    for chunk in iter_deck_chunks(decks, n_decks = n_decks, seed = seed, 
+                                  half_deck_size = half_deck_size, first_block = first_block):
+        for start in range(0, len(chunk), chunk_size):
+            piece = chunk[start:start + chunk_size]
+            leads = [score_chunk(piece)]
+            if reverse:
+                leads.append(score_chunk(np.ascontiguousarray(piece[:, ::-1])))
+            n_groups += len(piece)
+            for m, mode in enumerate(('tricks', 'cards')):
+                signs = [np.sign(lead[m]) for lead in leads]
+                for outcome in range(3):
+                    group = np.zeros((len(p1_codes), len(piece)), dtype = np.int8)
+                    for sign in signs:
+                        # The complement's outcome for a pair is the 
+                        # deck's outcome for the mirrored pair
+                        group += sign == 1 - outcome
+                        group += sign[mirror] == 1 - outcome
+                    counts[mode][outcome, p1_codes, p2_codes] += group.sum(axis = 1)
+                    squares[mode][outcome, p1_codes, p2_codes] += np.sum(group.astype(np.int64)**2, 
+                                                                         axis = 1)
+
+    n_samples = group_size * n_groups
+    diagonal = np.eye(n_sequences, dtype = bool)
+    counts['variance_reduction'] = {}
+    for mode in ('tricks', 'cards'):
+        counts[mode][1][diagonal] = n_samples
+        p = counts[mode] / max(n_samples, 1)
+        # The estimates are (group total) / group_size per generated deck, 
+        # against a single outcome per deck for count_outcomes
+        group_variance = squares[mode] / max(n_groups, 1) - (group_size * p)**2
+        independent_variance = group_size**2 * p * (1 - p)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            counts['variance_reduction'][mode] = np.where(
+                group_variance > 0, independent_variance / group_variance, np.nan)
+    counts['n_decks'] = n_samples
+    if decks is None:
+        counts['provenance'] = [deck_provenance(n_groups, seed, length = length, 
+                                                half_deck_size = half_deck_size, 
+                                                first_block = first_block, 
+                                                samples_per_deck = group_size)]
+    return counts
+
+def _pair_probabilities(mode_counts: np.ndarray, 
+                        i: int, 
+                        j: int, 
+                        n_decks: int
+                        ) -> dict:
+    """
+    Build penneys_game's win/loss/draw dictionary for a single pair
+    """
+    win, draw, loss = mode_counts[:, i, j] / n_decks
+    return {
+        'win': win,
+        'loss': loss,
+        'draw': draw,
+        'player2_win_probability': win,
+        'player1_win_probability': loss
+    }
+
+def _segment_probabilities(p1_sequence: str, 
+                           p2_sequence: str, 
+                           half_deck_size: int
+                           ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Score the card strings that make up a segment between two resets
+
+    A segment starts right after a reset (or at the start of the deck). 
+    Every arrangement of x blacks and y reds is equally likely whatever 
+    is left in the deck, so these probabilities are computed once per 
+    pair and shared by every reset state of the game. They are kept as 
+    fractions of the C(x + y, x) arrangements rather than raw counts, 
+    which would overflow float64 for large shoes.
+
+    Args:
+        p1_sequence (str): Player 1's sequence
+        p2_sequence (str): Player 2's sequence (different from player 1's)
+        half_deck_size (int): The number of cards of each color
+
+    Returns:
+        ends (np.ndarray): Array of shape (2, H + 1, H + 1) where 
+        [k, x, y] is the fraction of the strings of x blacks & y reds 
+        whose first match is on the last card, won by player 1 (k = 0) 
+        or 2 (k = 1)
+        alive (np.ndarray): Array of shape (H + 1, H + 1) with the 
+        fraction of the strings of x blacks & y reds with no match at all
+    """
+    size = half_deck_size + 1
+    next_state, events = compile_automaton(p1_sequence, p2_sequence)
+    # Strings with no match yet, by the automaton state they end in
+    by_state = np.zeros((size, size, len(next_state)))
+    by_state[0, 0, 0] = 1
+    ends = np.zeros((2, size, size))
+
+    for x in range(size):
+        for y in range(size):
+            for state in range(len(next_state)):
+                fraction = by_state[x, y, state]
+                if fraction == 0:
+                    continue
+                # C(x + y, x) / C(x + y + 1, x + 1) & likewise for a red
+                for card, (nx, ny), scale in ((0, (x + 1, y), (x + 1) / (x + y + 1)), 
+                                              (1, (x, y + 1), (y + 1) / (x + y + 1))):
+                    if nx == size or ny == size:
+                        continue
+                    if events[state, card]:
+                        ends[events[state, card] - 1, nx, ny] += fraction * scale
+                    else:
+                        by_state[nx, ny, next_state[state, card]] += fraction * scale
+    return ends, by_state.sum(axis = 2)
+
+def _exact_pair(p1_sequence: str, 
+                p2_sequence: str, 
+                half_deck_size: int
+                ) -> dict:
+    """
+    Compute the exact distribution of player 2's lead for a single pair
+
+    The game restarts from an empty window after every match, so it is 
+    a chain of segments. Starting from the full deck, the probability 
+    of reaching each reset state (blacks & reds left in the deck) with 
+    each lead is pushed forward one segment at a time, from the states 
+    with the most cards left down to the empty deck.
+
+    Returns:
+        A dictionary with the probability that player 2 wins ([0]), 
+        draws ([1]) or loses ([2]) by 'tricks' & by 'cards'
+
+    Raises:
+        ValueError: If the probabilities are not finite or do not add up 
+        to 1 (a loss of floating point precision)
+    """
+    H = half_deck_size
+    size = H + 1
+    ends, alive = _segment_probabilities(p1_sequence, p2_sequence, H)
+
+    # log(a!) for a = 0, ..., 2H, so that the hypergeometric weights are 
+    # computed in log space (the factorials overflow float64 past 170)
+    log_factorial = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, 2 * H + 1)))))
+
+    def log_choose(a, k):
+        return log_factorial[a] - log_factorial[k] - log_factorial[a - k]
+
+    # Lead (p2 - p1) offsets: at most 2H // 3 tricks and 2H cards each
+    max_lead = {'tricks': 2 * H // len(p1_sequence), 'cards': 2 * H}
+    # reached[mode][n][B, lead] = P(a reset with n cards left, B of them black)
+    reached = {mode: np.zeros((2 * H + 1, size, 2 * lead + 1)) for mode, lead in max_lead.items()}
+    final = {mode: np.zeros(2 * lead + 1) for mode, lead in max_lead.items()}
+    for mode, lead in max_lead.items():
+        reached[mode][2 * H, H, lead] = 1
+
+    blacks = np.arange(size)
+    for n in range(2 * H, -1, -1):
+        reds = n - blacks
+        feasible = (reds >= 0) & (reds <= H)
+        safe_reds = np.clip(reds, 0, H)
+        if not np.any(reached['cards'][n]):
+            continue
+
+        # No further match: the remaining cards go to nobody
+        no_match = np.where(feasible, alive[blacks, safe_reds], 0)
+        for mode in final:
+            final[mode] += no_match @ reached[mode][n]
+
+        # The next segment uses x of the B blacks and L - x of the reds
+        x = blacks[None, :] - blacks[:, None]  # [B', B] -> x = B - B'
+        safe_x = np.clip(x, 0, H)
+        for L in range(min(len(p1_sequence), len(p2_sequence)), n + 1):
+            y = L - x
+            valid = feasible[None, :] & (x >= 0) & (y >= 0) & (y <= safe_reds[None, :])
+            safe_y = np.clip(y, 0, H)
+            # P(the next L cards hold x of the B blacks & y of the reds)
+            log_weight = (log_choose(blacks[None, :], np.minimum(safe_x, blacks[None, :])) 
+                          + log_choose(safe_reds[None, :], np.minimum(safe_y, safe_reds[None, :])) 
+                          - log_choose(n, L))
+            weight = np.where(valid, np.exp(np.where(valid, log_weight, 0)), 0)
+            for winner, sign in ((0, -1), (1, 1)):
+                transfer = weight * ends[winner, safe_x, safe_y]
+                if not np.any(transfer):
+                    continue
+                for mode, shift in (('tricks', sign), ('cards', sign * L)):
+                    moved = transfer @ reached[mode][n]
+                    if shift > 0:
+                        reached[mode][n - L][:, shift:] += moved[:, :-shift]
+                    else:
+                        reached[mode][n - L][:, :shift] += moved[:, -shift:]
+
+    results = {}
+    for mode, lead in max_lead.items():
+        dist = final[mode]
+        results[mode] = np.array([dist[lead + 1:].sum(), dist[lead], dist[:lead].sum()])
+        if not np.all(np.isfinite(results[mode])) or abs(results[mode].sum() - 1) > 1e-9:
+            raise ValueError(f'The exact {mode} probabilities of {p1_sequence} vs {p2_sequence} '
+                             f'with {H} cards of each color add up to {results[mode].sum()}')
+    return results
+
+@timed()
+def exact_probabilities(half_deck_size: int = HALF_DECK_SIZE, 
+                        length: int = SEQUENCE_LENGTH
+                        ) -> dict:
+    """
+    Compute player 2's exact win/draw/loss probabilities with no sampling
+
+    Each unordered pair is solved once: swapping the players turns 
+    player 2's wins into losses, so both orders share the same work.
+
+    Args:
+        half_deck_size (int): The number of cards of each color (26)
+        length (int): The length of the sequences
+
+    Returns:
+        A dictionary in the same layout as the counts from score_all_pairs 
+        ('tricks' & 'cards' arrays of shape (3, 8, 8)) holding probabilities 
+        instead of counts, with 'n_decks' = 1
+    """
+    sequences = sequence_list(length)
+    n_sequences = len(sequences)
+    probabilities = empty_counts(length)
+    for mode in ('tricks', 'cards'):
+        probabilities[mode] = probabilities[mode].astype(float)
+        probabilities[mode][1][np.eye(n_sequences, dtype = bool)] = 1
+    probabilities['n_decks'] = 1
+
+    for i in range(n_sequences):
+        for j in range(i + 1, n_sequences):
+            result = _exact_pair(sequences[i], sequences[j], half_deck_size)
+            for mode in ('tricks', 'cards'):
+                probabilities[mode][:, i, j] = result[mode]
+                probabilities[mode][:, j, i] = result[mode][::-1]
+    return probabilities
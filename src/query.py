@@ -0,0 +1,143 @@
+import json
+import os
+import numpy as np
+from src.helpers import PATH_DATA
+from src.processing import confidence_interval, load_counts, sequence_list
+
+MODES = ('tricks', 'cards')
+
+def build_response_table(counts: dict,
+                         confidence: float = 0.95
+                         ) -> dict:
+    """
+    Rank player 2's responses to every sequence of player 1
+
+    Responses are ranked by player 2's win probability, ties broken by
+    the draw probability.
+
+    Args:
+        counts (dict): Outcome counts from score_all_pairs (or load_counts)
+        confidence (float): The confidence level of the Wilson intervals
+
+    Returns:
+        A dictionary with the 'n_decks' & 'confidence' behind the table &
+        the 'responses', mapping each mode & player 1's sequence to
+        player 2's ranked responses, each a dictionary of the 'sequence',
+        the 'win', 'draw' & 'loss' probabilities & the 'win_interval' &
+        'draw_interval' bounds
+    """
+    n_sequences = counts['tricks'].shape[-1]
+    sequences = sequence_list(int(np.log2(n_sequences)))
+    n_decks = np.broadcast_to(np.asarray(counts['n_decks'], dtype = np.int64),
+                              (n_sequences, n_sequences))
+
+    responses = {}
+    for mode in MODES:
+        probabilities = counts[mode] / np.maximum(n_decks, 1)
+        win_low, win_high = confidence_interval(counts[mode][0], n_decks, confidence)
+        draw_low, draw_high = confidence_interval(counts[mode][1], n_decks, confidence)
+        responses[mode] = {}
+        for i, p1_sequence in enumerate(sequences):
+            ranked = sorted((j for j in range(n_sequences) if j != i),
+                            key = lambda j: (-probabilities[0, i, j], -probabilities[1, i, j]))
+            responses[mode][p1_sequence] = [
+                {'sequence': sequences[j],
+                 'win': float(probabilities[0, i, j]),
+                 'draw': float(probabilities[1, i, j]),
+                 'loss': float(probabilities[2, i, j]),
+                 'win_interval': [float(win_low[i, j]), float(win_high[i, j])],
+                 'draw_interval': [float(draw_low[i, j]), float(draw_high[i, j])]}
+                for j in ranked]
+
+    total_decks = counts['n_decks']
+    return {'n_decks': int(total_decks) if np.ndim(total_decks) == 0 else int(np.max(total_decks)),
+            'confidence': confidence,
+            'responses': responses}
+
+def save_response_table(table: dict,
+                        filename: str
+                        ) -> None:
+    """
+    Save a response table as JSON in the probability_data folder
+
+    Args:
+        table (dict): The table from build_response_table
+        filename (str): The name of the .json file
+    """
+    os.makedirs(PATH_DATA, exist_ok = True)
+    path = os.path.join(PATH_DATA, filename)
+    # Replace the previous table only once the new one is fully written
+    with open(path + '.tmp', 'w') as f:
+        json.dump(table, f)
+    os.replace(path + '.tmp', path)
+
+def load_response_table(filename: str
+                        ) -> dict:
+    """
+    Load a response table saved by save_response_table
+
+    Args:
+        filename (str): The name of the .json file
+
+    Returns:
+        The response table, in the format returned by build_response_table
+    """
+    with open(os.path.join(PATH_DATA, filename)) as f:
+        return json.load(f)
+
+def response_table_from_counts(counts_file: str,
+                               output_file: str,
+                               confidence: float = 0.95
+                               ) -> dict:
+    """
+    Build the response table of a stored counts file & save it
+
+    Args:
+        counts_file (str): The name of the counts .npz file
+        output_file (str): The name of the table's .json file
+        confidence (float): The confidence level of the Wilson intervals
+
+    Returns:
+        The response table
+    """
+    table = build_response_table(load_counts(counts_file), confidence)
+    save_response_table(table, output_file)
+    return table
+
+def best_responses(table: dict,
+                   p1_sequence: str,
+                   mode: str = 'cards'
+                   ) -> list[dict]:
+    """
+    Look up player 2's ranked responses to player 1's sequence
+
+    Args:
+        table (dict): The table from build_response_table
+        p1_sequence (str): Player 1's sequence (e.g. 'BRR')
+        mode (str): 'tricks' or 'cards'
+
+    Returns:
+        The ranked responses, best first (shared with the table, so they
+        should not be modified)
+    """
+    try:
+        return table['responses'][mode][p1_sequence]
+    except KeyError:
+        raise ValueError(f'No responses for {p1_sequence!r} by {mode!r}') from None
+
+def best_response(table: dict,
+                  p1_sequence: str,
+                  mode: str = 'cards'
+                  ) -> dict:
+    """
+    Look up player 2's best response to player 1's sequence
+
+    Args:
+        table (dict): The table from build_response_table
+        p1_sequence (str): Player 1's sequence (e.g. 'BRR')
+        mode (str): 'tricks' or 'cards'
+
+    Returns:
+        The best response (see build_response_table)
+    """
+    return best_responses(table, p1_sequence, mode)[0]
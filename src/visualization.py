@@ -1,23 +1,26 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 import os
 import numpy as np
-import matplotlib.patches as patches
-from src.datagen import store_decks
-from processing import calculate_win_probabilities
+from src.datagen import next_free_block, read_manifest, store_decks, store_loaders
+from src.helpers import PATH_DATA, timed
+from src.processing import (count_outcomes, counts_from_probabilities, deck_provenance, 
+                            load_counts, merge_counts, probability_arrays, save_counts, 
+                            sequence_list)
 
 # Specify the number of initial decks and initial seed
 initial_num_decks = 1_000_000
 initial_seed = 42
 
-# Define the path for the initial heatmap data files
+# Define the file for the initial win/draw/loss counts (in probability_data)
+initial_counts_data = f'counts_{initial_num_decks}_decks.npz'
+
+# Older runs stored win/draw probabilities instead of counts
 initial_cards_data = f'probability_data/cards_{initial_num_decks}_decks.npy'
 initial_tricks_data = f'probability_data/tricks_{initial_num_decks}_decks.npy'
 
 def all_possible_sequences(length: int) -> list:
     """
-    Generate all possible sequences of length 3 (total of 8)
+    Generate all possible sequences of a given length (8 for length 3)
 
     Args:
         length (int): The length of the sequence
@@ -25,13 +28,134 @@ def all_possible_sequences(length: int) -> list:
     Returns:
         A list of all possible sequences
     """
-    return [format(i, f'0{length}b').replace('0', 'B').replace('1', 'R') for i in range(8)]
+    return sequence_list(length)
+
+# The figure & artists reused by every heatmap (see heatmap_artists)
+_heatmap = {}
+
+def heatmap_artists(n_sequences: int) -> dict:
+    """
+    Get the figure used for the heatmaps, creating it on first use
+
+    The figure, the heatmap cells & the cell labels are created once and 
+    only updated for each heatmap, so rendering many results does not 
+    build (and leak) a new figure every time.
+
+    Args:
+        n_sequences (int): The number of sequences (rows/columns)
+
+    Returns:
+        A dictionary with the 'figure', 'ax', 'mesh' (the heatmap cells), 
+        'texts' (the cell labels) & 'title'
+    """
+    if _heatmap.get('n_sequences') == n_sequences:
+        return _heatmap
+    close_heatmaps()
+
+    # The plotting stack is only imported once something is drawn, so the 
+    # simulation can run (and import this module) with NumPy alone
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    import seaborn as sns
+
+    ax_labels = all_possible_sequences(n_sequences.bit_length() - 1)
+    figure, ax = plt.subplots(figsize = (12, 8))
+    sns.heatmap(np.zeros((n_sequences, n_sequences)), annot = False, cmap = 'Blues',
+                xticklabels = ax_labels, yticklabels = ax_labels, cbar = False, 
+                linewidths = 0.65, linecolor = 'white', square = True, ax = ax)
+
+    # Creates a rectangle with length and width = 1 for each cell
+    for i in range(n_sequences):
+        ax.add_patch(patches.Rectangle((i, i), 1, 1, facecolor = 'lightgray', linewidth = 0.65, 
+                                       edgecolor = 'white', zorder = 4))
+    # 0.5 is half of the cell size
+    texts = [[ax.text(j + 0.5, i + 0.5, '', ha = 'center', va = 'center') 
+              for j in range(n_sequences)] for i in range(n_sequences)]
+
+    ax.set_xlabel('Player 2 Sequence')
+    ax.set_ylabel('Player 1 Sequence')
+    _heatmap.update(n_sequences = n_sequences, figure = figure, ax = ax, 
+                    mesh = ax.collections[0], texts = texts, title = ax.set_title(''))
+    return _heatmap
+
+def close_heatmaps() -> None:
+    """
+    Close the figure used for the heatmaps (recreated on the next render)
+    """
+    if _heatmap:
+        import matplotlib.pyplot as plt
+        plt.close(_heatmap['figure'])
+        _heatmap.clear()
+
+def draw_heatmap(data: np.ndarray, 
+                 mode: str, 
+                 output_file: str, 
+                 n_decks: int
+                 ) -> str:
+    """
+    Draw and save one heatmap of player 2's win (draw) probabilities
 
+    Args:
+        data (np.ndarray): Player 2's win & draw probabilities, shape (2, 8, 8)
+        mode (str): The scoring method ('cards' or 'tricks')
+        output_file (str): The name of the output file
+        n_decks (int | np.ndarray): The number of decks, either overall 
+        or per pair (see deck_count_label)
+
+    Returns:
+        The path of the PNG
+    """
+    artists = heatmap_artists(data.shape[-1])
+    win_percent = data[0] * 100
+    artists['mesh'].set_array(win_percent)
+    artists['mesh'].set_clim(win_percent.min(), win_percent.max())
+
+    for i, row in enumerate(artists['texts']):
+        for j, text in enumerate(row):
+            win_prob, draw_prob = data[0, i, j], data[1, i, j]
+            text.set_text(f'{win_prob * 100:.0f} ({draw_prob * 100:.0f})')
+            # If win prob is > 50%, use white text
+            text.set_color('white' if win_prob > 0.5 else 'black')
+
+    artists['title'].set_text(f"Penney's Game Probabilities for P2 \n "
+                              f"Win (Draw) by {mode.capitalize()} \n N = {deck_count_label(n_decks)}")
+    artists['figure'].tight_layout()
+
+    # Saves as a PNG with timestamp
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    os.makedirs('heatmaps', exist_ok = True)
+    file_path = os.path.join('heatmaps', f'{mode}_{output_file}_{timestamp}.png')
+    artists['figure'].savefig(file_path)
+    print(f'Saved heatmap as {mode}_{output_file}_{timestamp}.png')
+    return file_path
+
+def deck_count_label(n_decks) -> str:
+    """
+    Describe the number of decks behind a heatmap for its title
+
+    Args:
+        n_decks (int | np.ndarray): The number of decks, either overall 
+        or per pair
+
+    Returns:
+        The number of decks, or the range of the per-pair numbers of 
+        decks (the diagonal is never scored, so it is left out)
+    """
+    n_decks = np.asarray(n_decks)
+    if n_decks.ndim == 0:
+        return str(int(n_decks))
+    per_pair = n_decks[~np.eye(len(n_decks), dtype = bool)]
+    if per_pair.min() == per_pair.max():
+        return str(int(per_pair.min()))
+    return f'{per_pair.min()}-{per_pair.max()} per pair'
+
+@timed()
 def create_heatmaps(cards_data: np.ndarray, 
                     tricks_data: np.ndarray, 
                     output_file: str, 
                     n_decks: int, 
-                    ) -> None:
+                    close: bool = True
+                    ) -> list[str]:
     """
     Create the heatmaps that contain totals and tricks win/draw probabilities
 
@@ -39,136 +163,94 @@ def create_heatmaps(cards_data: np.ndarray,
         cards_data (np.ndarray): The heatmap for cards (p2's probabilities)
         tricks_data (np.ndarray): The heatmap for tricks (p2's probabilities)
         output_file (str): The name of the output file
-        n_decks (int): The number of decks
+        n_decks (int | np.ndarray): The number of decks, either overall 
+        or per pair like the counts from processing.adaptive_outcomes
+        close (bool): Close the figure afterwards (keep it open to reuse 
+        it for the next heatmaps)
 
     Returns:
-        None
+        The paths of the cards & tricks PNGs
     """
-    ax_labels = ['BBB', 'BBR', 'BRB', 'BRR', 'RBB', 'RBR', 'RRB', 'RRR']
-    
-    # For cards heatmap
-    plt.figure(figsize = (12, 8))
-    ax1 = sns.heatmap(cards_data[0] * 100, annot = False, cmap = 'Blues',
-                      xticklabels = ax_labels, yticklabels = ax_labels, cbar = False, 
-                      linewidths = 0.65, linecolor = 'white', square = True,
-                      cbar_kws = {'label': 'Player 2 Win Probability'})
-    
-    # Creates a rectangle with length and width = 1 for each cell
-    for i in range(len(ax_labels)):
-        ax1.add_patch(patches.Rectangle((i, i), 1, 1, facecolor = 'lightgray', linewidth = 0.65, 
-                                         edgecolor = 'white', zorder = 4)) 
-
-    for i in range(8):
-        for j in range(8):
-            win_prob = cards_data[0, i, j]
-            draw_prob = cards_data[1, i, j]
-            text = f"{win_prob * 100:.0f} ({draw_prob * 100:.0f})"
-            text_color = 'white' if win_prob > 0.5 else 'black' # If win prob is > 50%, use white text
-            # 0.5 is half of the cell size
-            ax1.text(j + 0.5, i + 0.5, text, ha = 'center', va = 'center', color = text_color)
-
-    plt.title(f"Penney's Game Probabilities for P2 \n Win (Draw) by Cards \n N = {n_decks}")
-    plt.xlabel('Player 2 Sequence')
-    plt.ylabel('Player 1 Sequence')
-    plt.tight_layout()
-
-    # Saves as a PNG with timestamp
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    file_path = os.path.join('heatmaps', f'cards_{output_file}_{timestamp}.png')
-    plt.savefig(file_path)
-    print(f'Saved heatmap as cards_{output_file}_{timestamp}.png')
-    plt.clf()
-
-    # For tricks heatmap
-    plt.figure(figsize = (12, 8))
-    ax2 = sns.heatmap(tricks_data[0] * 100, annot = False, cmap = 'Blues',
-                      xticklabels = ax_labels, yticklabels = ax_labels, cbar = False, 
-                      linewidths = 0.65, linecolor = 'white', square = True,
-                      cbar_kws = {'label': 'Player 2 Win Probability'})
+    try:
+        return [draw_heatmap(cards_data, 'cards', output_file, n_decks), 
+                draw_heatmap(tricks_data, 'tricks', output_file, n_decks)]
+    finally:
+        if close:
+            close_heatmaps()
+
+@timed()
+def render_counts(counts_files: list[str], 
+                  output_files: list[str] | None = None
+                  ) -> list[str]:
+    """
+    Render the heatmaps of stored counts without simulating anything
 
-    # Creates a rectangle with length and width = 1 for each cell
-    for i in range(len(ax_labels)):
-        ax2.add_patch(patches.Rectangle((i, i), 1, 1, facecolor = 'lightgray', linewidth = 0.65, 
-                                         edgecolor = 'white', zorder= 4 ))
-
-    for i in range(8):
-        for j in range(8):
-            win_prob = tricks_data[0, i, j]
-            draw_prob = tricks_data[1, i, j]
-            text = f'{win_prob * 100:.0f} ({draw_prob * 100:.0f})'
-            text_color = 'white' if win_prob > 0.5 else 'black' # If win prob is > 50%, use white text
-            # 0.5 is half of the cell size
-            ax2.text(j + 0.5, i + 0.5, text, ha = 'center', va = 'center', color = text_color)
-
-    plt.title(f"Penney's Game Probabilities for P2 \n Win (Draw) by Tricks \n N = {n_decks}")
-    plt.xlabel('Player 2 Sequence')
-    plt.ylabel('Player 1 Sequence')
-    plt.tight_layout()
+    Every result is drawn on the same figure, which is closed at the 
+    end, so memory use does not grow with the number of results.
 
-    # Saves as a PNG with timestamp
-    timestamp2 = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    file_path2 = os.path.join('heatmaps', f"tricks_{output_file}_{timestamp2}.png")
-    plt.savefig(file_path2)
-    print(f'Saved heatmap as tricks_{output_file}_{timestamp2}.png')
-    plt.clf()
+    Args:
+        counts_files (list): The names of the counts .npz files (in the 
+        probability_data folder)
+        output_files (list): The names used for the PNGs (the counts file 
+        names without the 'counts_' prefix if None)
 
-def generate_initial_heatmaps(n_decks):
+    Returns:
+        The paths of all of the PNGs
+    """
+    if output_files is None:
+        output_files = [os.path.splitext(name)[0].removeprefix('counts_') for name in counts_files]
+    paths = []
+    try:
+        for counts_file, output_file in zip(counts_files, output_files):
+            counts = load_counts(counts_file)
+            cards_data, tricks_data = probability_arrays(counts)
+            paths += create_heatmaps(cards_data, tricks_data, output_file, counts['n_decks'], 
+                                     close = False)
+    finally:
+        close_heatmaps()
+    return paths
+
+@timed()
+def generate_initial_heatmaps(n_decks, workers = 1):
     """
     Generate the cards/tricks heatmaps for initial_num_decks
 
     Args: 
         n_decks (int): The number of decks
+        workers (int): The number of processes used for scoring
     Returns:
-        The raw data file penneydecks_{initial_num_decks}.npy
+        The decks stored in penneydecks_{initial_num_decks}
     """
     unaugmented_decks, _ = store_decks(n_decks = n_decks, seed = initial_seed,
-                                       filename = f'penneydecks_{initial_num_decks}.npy', 
+                                       filename = f'penneydecks_{initial_num_decks}', 
                                        augment = False)
     
-    # Calculate the win probabilities for the initial number of decks
-    results = calculate_win_probabilities(n_decks = n_decks)
-
-    # Define all possible sequences of length 3 ('B' or 'R')
-    sequence_list = ['BBB', 'BBR', 'BRB', 'BRR', 'RBB', 'RBR', 'RRB', 'RRR']
-
-    # Initialize 3D arrays with cards/tricks probabilities
-    cards_data = np.zeros((2, 8, 8))  
-    tricks_data = np.zeros((2, 8, 8))  
-
-    # Populate the heatmaps with results
-    for i, seq1 in enumerate(sequence_list):
-        for j, seq2 in enumerate(sequence_list):
-            result = results.get((seq1, seq2))
-            if result:
-                # Extract the cards and tricks results
-                cards_result = result.get('cards', {}) # Empty dictionary is default
-                tricks_result = result.get('tricks', {})
-                
-                if 'win' in cards_result:
-                    cards_data[0, i, j] = cards_result['win']
-                    cards_data[1, i, j] = cards_result['draw']
-                
-                if 'win' in tricks_result:
-                    tricks_data[0, i, j] = tricks_result['win']
-                    tricks_data[1, i, j] = tricks_result['draw']
-
-    # Save the data as .npy files -> probability_data folder
-    if not os.path.exists('probability_data'):
-        os.makedirs('probability_data')  
-
-    np.save(initial_cards_data, cards_data)
-    np.save(initial_tricks_data, tricks_data)
+    # Count the wins/draws/losses using the stored decks
+    counts = count_outcomes(decks = store_loaders(f'penneydecks_{initial_num_decks}'), 
+                            workers = workers)
+    # Each chunk of the store holds the decks of its own seed
+    store_dir = os.path.join(PATH_DATA, f'penneydecks_{initial_num_decks}')
+    counts['provenance'] = [deck_provenance(chunk['n_decks'], chunk['seed'], 
+                                            stream = chunk.get('stream', 'store'), 
+                                            source = f'penneydecks_{initial_num_decks}')
+                            for chunk in read_manifest(store_dir)['chunks']]
+
+    # Save the integer counts -> probability_data folder
+    save_counts(counts, initial_counts_data)
 
     # Create and save the heatmaps as PNGs
+    cards_data, tricks_data = probability_arrays(counts)
     create_heatmaps(cards_data, tricks_data, output_file = f'{initial_num_decks}_decks', 
-                    n_decks = n_decks)
+                    n_decks = counts['n_decks'])
     
     return unaugmented_decks
 
+@timed()
 def fill_heatmaps(seed: int,
                   n_decks: int, 
                   augment_decks: int, 
-                  output_file: str
+                  output_file: str, 
+                  workers: int = 1
                   ) -> None:
     """
     Populate the heatmaps for Penney's Game simulation
@@ -178,14 +260,14 @@ def fill_heatmaps(seed: int,
         n_decks (int): The number of decks
         augment_decks (int): The number of additional decks to augment
         output_file (str): The base name for the file containing the heatmaps
+        workers (int): The number of processes used for scoring
 
     Returns:
         None
     """
-    # Load the intial probability data
+    # Load the intial counts
     try:
-        cards_data = np.load(initial_cards_data)
-        tricks_data = np.load(initial_tricks_data)
+        counts = load_base_counts(n_decks)
 
     # Raise an error if the initial data is not found
     except FileNotFoundError as e:
@@ -193,47 +275,61 @@ def fill_heatmaps(seed: int,
         return
 
     total_decks = n_decks + augment_decks
-    augmented_cards_data = f'probability_data/cards_{total_decks}_decks_augmented.npy'
-    augmented_tricks_data = f'probability_data/tricks_{total_decks}_decks_augmented.npy'
-    
-    # Load augmented data if it already exists
-    if os.path.exists(augmented_cards_data) and os.path.exists(augmented_tricks_data):
-        cards_data = np.load(augmented_cards_data)
-        tricks_data = np.load(augmented_tricks_data)
+    augmented_counts_data = f'counts_{total_decks}_decks_augmented.npz'
 
-    # Augment data if desired
-    else:
-        store_decks(n_decks = augment_decks, seed = seed, 
-                    filename = f'penneydecks_{total_decks}_augmented.npy',
-                    augment = True)
-        results = calculate_win_probabilities(n_decks = augment_decks)
-        sequence_list = ['BBB', 'BBR', 'BRB', 'BRR', 'RBB', 'RBR', 'RRB', 'RRR']
-
-    # Fill the heatmaps with game outcomes
-        for i, seq1 in enumerate(sequence_list):
-            for j, seq2 in enumerate(sequence_list):
-                result = results.get((seq1, seq2))
-            # Check if result (win probability) exists
-                if result is not None:
-                    # Break down into tricks and cards results
-                    tricks_result = result.get('tricks', {})
-                    cards_result = result.get('cards', {}) 
-
-                # If player 2 wins in both tricks and cards
-                if 'win' in tricks_result and 'win' in cards_result:
-                        total_decks = n_decks + augment_decks
-                        # Combine initial and new data by using a weighted average
-                        tricks_data[0, i, j] = (tricks_data[0, i, j] * n_decks + tricks_result['win'] * augment_decks) / (total_decks) 
-                        tricks_data[1, i, j] = (tricks_data[1, i, j] * n_decks + tricks_result['draw'] * augment_decks) / (total_decks) 
-                        cards_data[0, i, j] = (cards_data[0, i, j] * n_decks + cards_result['win'] * augment_decks) / (total_decks) 
-                        cards_data[1, i, j] = (cards_data[1, i, j] * n_decks + cards_result['draw'] * augment_decks) / (total_decks) 
-    
-    # Save the augmented data as .npy files
-    np.save(augmented_cards_data, cards_data)
-    np.save(augmented_tricks_data, tricks_data)
+    # Continue the seed's deck stream after every block the base counts 
+    # already used, so the new decks are never ones counted before
+    first_block = next_free_block(counts.get('provenance', []), seed)
+
+    # Count the new decks, reusing the cached counts of an earlier run with 
+    # the same seed, blocks, number of decks & engine version
+    new_counts = count_outcomes(n_decks = augment_decks, seed = seed, first_block = first_block, 
+                                workers = workers, use_cache = True)
+
+    # Combine initial and new data by adding the integer counts
+    counts = merge_counts(counts, new_counts)
+
+    # Save the augmented counts as a .npz file
+    save_counts(counts, augmented_counts_data)
 
     # Create/save the heatmaps
-    create_heatmaps(cards_data, tricks_data, output_file, n_decks + augment_decks)
+    cards_data, tricks_data = probability_arrays(counts)
+    create_heatmaps(cards_data, tricks_data, output_file, counts['n_decks'])
+
+def load_base_counts(n_decks: int) -> dict:
+    """
+    Load the win/draw/loss counts that an augmentation builds on
+
+    These are the counts of an earlier augmentation with 'n_decks' total 
+    decks if there is one, or else the initial counts. The older 
+    probability files are used as a fallback for the initial counts, 
+    recovered exactly by counts_from_probabilities.
+
+    Args:
+        n_decks (int): The number of decks behind the counts
+
+    Returns:
+        The outcome counts, in the format returned by score_all_pairs
+
+    Raises:
+        ValueError: If the counts found are not for 'n_decks' decks
+    """
+    augmented_counts_data = f'counts_{n_decks}_decks_augmented.npz'
+    if os.path.exists(os.path.join(PATH_DATA, augmented_counts_data)):
+        counts = load_counts(augmented_counts_data)
+    elif os.path.exists(os.path.join(PATH_DATA, initial_counts_data)):
+        counts = load_counts(initial_counts_data)
+    else:
+        counts = counts_from_probabilities(np.load(initial_cards_data), np.load(initial_tricks_data), 
+                                           n_decks = initial_num_decks)
+        counts['provenance'] = [deck_provenance(initial_num_decks, None, stream = 'legacy', 
+                                                source = os.path.basename(initial_cards_data))]
+    # The augmented file is named after the total, so a mismatch here 
+    # would be carried into every later augmentation
+    if counts['n_decks'] != n_decks:
+        raise ValueError(f'Found the counts of {counts["n_decks"]:,} decks instead of {n_decks:,} '
+                         f'(no counts_{n_decks}_decks_augmented.npz)')
+    return counts
 
 if __name__ == '__main__':
     # Actually generate the heatmaps for the initial number of decks